@@ -0,0 +1,737 @@
+# Бенчмарки школьной ORM системы.
+#
+# Запуск:
+#   python benchmarks.py connect [--iterations N]
+#   python benchmarks.py memory [--students N] [--batch-size N]
+#   python benchmarks.py entities [--students N] [--repeat N]
+#   python benchmarks.py indexes [--sizes 10000,100000,1000000]
+#   python benchmarks.py catalog [--sizes 10000,100000] [--iterations N]
+#   python benchmarks.py group-commit [--threads N] [--operations N] [--max-batch N] [--max-latency-ms MS]
+#   python benchmarks.py topology [--students N] [--readers N] [--seconds S]
+#   python benchmarks.py suite [--sizes 1000,10000] [--iterations N] [--seed N] [--output FILE]
+
+"""
+Набор воспроизводимых замеров производительности для level1/level2/level3.
+Все замеры выполняются на временных файлах БД и не трогают school.db.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import level1
+import level2
+import level3
+
+CITIES = ['Spb', 'Moscow', 'Manchester', 'Kazan', 'Omsk', 'London', 'Paris', 'Berlin']
+NAMES = ['Max', 'John', 'Andy', 'Kate', 'Ivan', 'Maria', 'Alex', 'Olga']
+SURNAMES = ['Brooks', 'Stones', 'Wings', 'Petrov', 'Ivanov', 'Smith', 'Sidorova']
+
+
+def measure(func: Callable[[], object], iterations: int) -> List[float]:
+    """Замер времени каждого вызова func (в секундах)"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Сводка по замерам в микросекундах"""
+    return {
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p50_us': statistics.median(timings) * 1e6,
+        'max_us': max(timings) * 1e6,
+    }
+
+
+def print_table(title: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{title}")
+    print("-" * 76)
+    columns = list(next(iter(results.values())).keys())
+    print(f"{'вариант':<32}" + "".join(f"{c:>14}" for c in columns))
+    for name, row in results.items():
+        print(f"{name:<32}" + "".join(f"{row[c]:>14.2f}" for c in columns))
+    print("-" * 76)
+
+
+def populate(db_path: str, students: int, courses: int = 10, seed: int = 42,
+             schema_version: int = level3.SCHEMA_VERSION) -> None:
+    """Детерминированный синтетический набор данных в схеме level3 указанной версии"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    for version in range(1, schema_version + 1):
+        for statement in level3.SCHEMA_MIGRATIONS[version]:
+            conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {schema_version}")
+    conn.executemany(
+        "INSERT INTO Courses (id, name, time_start, time_end) VALUES (?, ?, ?, ?)",
+        ((i, f'course_{i}', '2024-01-01', '2024-06-01') for i in range(1, courses + 1))
+    )
+    conn.executemany(
+        "INSERT INTO Students (id, name, surname, age, city) VALUES (?, ?, ?, ?, ?)",
+        ((i, rnd.choice(NAMES), rnd.choice(SURNAMES), rnd.randint(14, 80), rnd.choice(CITIES))
+         for i in range(1, students + 1))
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO Student_Courses (student_id, course_id) VALUES (?, ?)",
+        ((i, rnd.randint(1, courses)) for i in range(1, students + 1) for _ in range(rnd.randint(1, 3)))
+    )
+    conn.commit()
+    conn.close()
+
+
+def peak_memory(func: Callable[[], object]) -> float:
+    """Пиковое потребление памяти Python-объектами при вызове func (МБ)"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+# =============================================================================
+# ПОДКЛЮЧЕНИЕ: bootstrap схемы на каждом соединении vs PRAGMA user_version
+# =============================================================================
+
+def _connect_with_bootstrap(db_path: str) -> None:
+    """Прежнее поведение level3: CREATE TABLE IF NOT EXISTS + коммит на каждое подключение"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    for statement in level3.SCHEMA_MIGRATIONS[1]:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def _connect_with_user_version(db_path: str) -> None:
+    """Новое соединение с проверкой версии схемы"""
+    conn = sqlite3.connect(db_path)
+    level3.DatabaseManager.prepare_connection(conn)
+    conn.close()
+
+
+def bench_connect(iterations: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_connect.db')
+        _connect_with_user_version(db_path)  # файл создается один раз
+
+        pool = level3.ConnectionPool(db_path, max_size=1,
+                                     initializer=level3.DatabaseManager.prepare_connection)
+
+        def pooled():
+            with level3.DatabaseManager(db_path, pool=pool):
+                pass
+
+        results = {
+            'bootstrap каждый раз': summarize(measure(lambda: _connect_with_bootstrap(db_path), iterations)),
+            'PRAGMA user_version': summarize(measure(lambda: _connect_with_user_version(db_path), iterations)),
+            'пул DatabaseManager': summarize(measure(pooled, iterations)),
+        }
+        pool.close()
+    return results
+
+
+# =============================================================================
+# ПАМЯТЬ: fetchall-списки vs потоковые iter_* через fetchmany
+# =============================================================================
+
+def bench_memory(students: int, batch_size: int) -> Dict[str, Dict[str, float]]:
+    def consume(rows) -> int:
+        count = 0
+        for _ in rows:
+            count += 1
+        return count
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_memory.db')
+        populate(db_path, students)
+        pool = level3.ConnectionPool(db_path, max_size=1,
+                                     initializer=level3.DatabaseManager.prepare_connection)
+        with level3.DatabaseManager(db_path, pool=pool) as service:
+            cases = {
+                'level3 get_all': lambda: consume(service.students.get_all()),
+                'level3 iter_all': lambda: consume(service.students.iter_all(batch_size)),
+            }
+            for name, case in cases.items():
+                started = time.perf_counter()
+                peak = peak_memory(case)
+                results[name] = {'peak_mb': peak, 'seconds': time.perf_counter() - started}
+        pool.close()
+
+        with level2.DatabaseManager(db_path) as db:
+            repo = level2.StudentRepository(db)
+            cases = {
+                'level2 get_all': lambda: consume(repo.get_all()),
+                'level2 iter_all': lambda: consume(repo.iter_all(batch_size)),
+            }
+            for name, case in cases.items():
+                started = time.perf_counter()
+                peak = peak_memory(case)
+                results[name] = {'peak_mb': peak, 'seconds': time.perf_counter() - started}
+    return results
+
+
+# =============================================================================
+# СУЩНОСТИ: dataclass + sqlite3.Row vs slots + кортежи vs сырые кортежи
+# =============================================================================
+
+@dataclass
+class LegacyStudent:
+    """Прежняя сущность level3: dataclass с __dict__, сборка по именам колонок sqlite3.Row"""
+    id: Optional[int] = None
+    name: str = ""
+    surname: str = ""
+    age: int = 0
+    city: str = ""
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'LegacyStudent':
+        return cls(id=row['id'], name=row['name'], surname=row['surname'],
+                   age=row['age'], city=row['city'])
+
+
+def retained_memory(func: Callable[[], list]) -> Tuple[list, int]:
+    """Результат func и объем удерживаемой им памяти (байты)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_entities(students: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_entities.db')
+        populate(db_path, students)
+        pool = level3.ConnectionPool(db_path, max_size=1,
+                                     initializer=level3.DatabaseManager.prepare_connection)
+        with level3.DatabaseManager(db_path, pool=pool) as service:
+            conn = service.db  # row_factory = sqlite3.Row, как у прежних репозиториев
+            cases = {
+                'dataclass + sqlite3.Row': lambda: [LegacyStudent.from_row(row)
+                                                    for row in conn.execute("SELECT * FROM Students")],
+                'slots + from_tuple': service.students.get_all,
+                'сырые кортежи': lambda: service.students.get_all(raw=True),
+            }
+            for name, case in cases.items():
+                best = min(measure(case, repeat))
+                rows, size = retained_memory(case)
+                results[name] = {
+                    'rows_per_sec': len(rows) / best,
+                    'bytes_per_row': size / len(rows),
+                }
+                del rows
+        pool.close()
+    return results
+
+
+# =============================================================================
+# ИНДЕКСЫ: задержка запросов до и после миграции индексов
+# =============================================================================
+
+INDEX_QUERIES = {
+    'get_by_city': lambda service: service.students.get_by_city('Kazan'),
+    'get_by_age_gt': lambda service: service.students.get_by_age_gt(78),
+    'get_by_course': lambda service: service.students.get_by_course('course_3'),
+    'get_students_on_course': lambda service: service.enrollments.get_students_on_course(3),
+}
+
+
+def bench_indexes(sizes: List[int], iterations: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db_path = os.path.join(tmp, f'bench_indexes_{size}.db')
+            # Схема версии 1 - как у файлов, созданных до появления индексов
+            populate(db_path, size, courses=50, schema_version=1)
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            service = level3.SchoolService(conn)
+
+            timings = {name: summarize(measure(lambda: query(service), iterations))['p50_us']
+                       for name, query in INDEX_QUERIES.items()}
+            level3.DatabaseManager._create_tables(conn)  # миграция до актуальной версии
+            for name, query in INDEX_QUERIES.items():
+                after = summarize(measure(lambda: query(service), iterations))['p50_us']
+                results[f'{name} {size}'] = {
+                    'before_ms': timings[name] / 1000,
+                    'after_ms': after / 1000,
+                    'speedup': timings[name] / after,
+                }
+            conn.close()
+    return results
+
+
+# =============================================================================
+# КАТАЛОГ КУРСОВ: JOIN по Courses.name vs course_id из каталога в памяти
+# =============================================================================
+
+# Запрос level1/level2 без каталога - три таблицы и фильтр по c.name
+LEGACY_BY_COURSE_QUERY = '''
+    SELECT s.* FROM Students s
+    JOIN Student_courses sc ON s.id = sc.student_id
+    JOIN Courses c ON sc.course_id = c.id
+    WHERE c.name = ?
+'''
+CATALOG_COURSES = 500
+
+
+def bench_catalog(sizes: List[int], iterations: int) -> Dict[str, Dict[str, float]]:
+    def compare(before: Callable[[], object], after: Callable[[], object]) -> Dict[str, float]:
+        before_us = summarize(measure(before, iterations))['p50_us']
+        after_us = summarize(measure(after, iterations))['p50_us']
+        return {'join_us': before_us, 'catalog_us': after_us, 'speedup': before_us / after_us}
+
+    def without_catalog(repository, run: Callable[[], object]) -> Callable[[], object]:
+        def call():
+            catalog, repository.catalog = repository.catalog, None
+            try:
+                return run()
+            finally:
+                repository.catalog = catalog
+        return call
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db_path = os.path.join(tmp, f'bench_catalog_{size}.db')
+            # Много курсов - небольшие выборки, на которых заметна постоянная часть запроса
+            populate(db_path, size, courses=CATALOG_COURSES)
+
+            with level2.DatabaseManager(db_path, course_catalog=True) as db:
+                students = level2.StudentRepository(db)
+                results[f'level2 get_by_course {size}'] = compare(
+                    lambda: db.fetch_all(LEGACY_BY_COURSE_QUERY, ('course_3',)),
+                    lambda: students.get_by_course('course_3'),
+                )
+
+            conn = sqlite3.connect(db_path)
+            level3.DatabaseManager.prepare_connection(conn)
+            service = level3.SchoolService(conn, identity_map_size=0, course_catalog=True)
+            query = service.students.query().filter(city='Spb').in_course('course_3')
+            for name, run in (('get_by_course', lambda: service.students.get_by_course('course_3')),
+                              ('course_and_city', query.all)):
+                results[f'level3 {name} {size}'] = compare(without_catalog(service.students, run), run)
+            conn.close()
+    return results
+
+
+# =============================================================================
+# ГРУППОВОЙ КОММИТ: транзакция на каждый create_student vs WriteQueue
+# =============================================================================
+
+def _concurrent_creates(threads: int, operations: int, session: Callable) -> Tuple[float, List[float]]:
+    """
+    threads потоков по operations вызовов create_student; общее время и задержка каждого вызова.
+    session() - контекстный менеджер потока, выдающий функцию создания студента.
+    """
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(seed: int):
+        rnd = random.Random(seed)
+        timings = []
+        with session() as create:
+            for _ in range(operations):
+                data = {'id': None, 'name': rnd.choice(NAMES), 'surname': rnd.choice(SURNAMES),
+                        'age': rnd.randint(14, 80), 'city': rnd.choice(CITIES)}
+                started = time.perf_counter()
+                create(data)
+                timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def bench_group_commit(threads: int, operations: int, max_batch: int,
+                       max_latency_ms: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ('durable', 'balanced'):
+            db_path = os.path.join(tmp, f'bench_group_commit_{profile}.db')
+            populate(db_path, 0, courses=1)
+            pool = level3.ConnectionPool(
+                db_path, max_size=threads + 1,
+                initializer=partial(level3.DatabaseManager.prepare_connection, profile=profile)
+            )
+
+            @contextmanager
+            def direct():
+                # Каждый поток - своя сессия и свой коммит на каждого студента
+                with level3.DatabaseManager(db_path, pool=pool) as service:
+                    yield service.create_student
+
+            elapsed, latencies = _concurrent_creates(threads, operations, direct)
+            results[f'{profile} коммит на вызов'] = _group_commit_row(elapsed, latencies)
+
+            manager = level3.DatabaseManager(db_path, pool=pool, identity_map_size=0)
+            with level3.WriteQueue(manager, max_batch=max_batch, max_latency_ms=max_latency_ms) as writes:
+                elapsed, latencies = _concurrent_creates(
+                    threads, operations, lambda: nullcontext(lambda data: writes.create_student(data).result())
+                )
+                results[f'{profile} WriteQueue'] = _group_commit_row(elapsed, latencies)
+            pool.close()
+    return results
+
+
+def _group_commit_row(elapsed: float, latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+    }
+
+
+# =============================================================================
+# ТОПОЛОГИЯ: общий пул (журнал отката) vs один писатель + читатели mode=ro (WAL)
+# =============================================================================
+
+# Строк на транзакцию писателя: больше кэша страниц durable - в журнале отката
+# запись выталкивает страницы на диск и берет EXCLUSIVE-блокировку до коммита
+TOPOLOGY_WRITE_ROWS = 50_000
+
+
+def _reads_under_writes(manager: Callable[[], level3.DatabaseManager], readers: int,
+                        seconds: float) -> Dict[str, float]:
+    """Задержка get_by_id в readers потоках, пока писатель непрерывно выполняет длинные транзакции"""
+    stop = threading.Event()
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def writer():
+        with manager() as service:
+            while not stop.is_set():
+                with service.transaction():
+                    service.students.create_many(
+                        level3.Student(None, 'Max', 'Brooks', 30, 'Spb') for _ in range(TOPOLOGY_WRITE_ROWS)
+                    )
+                    time.sleep(0.02)  # длинная транзакция держит блокировку записи
+
+    def reader(seed: int):
+        rnd = random.Random(seed)
+        timings = []
+        with manager() as service:
+            while not stop.is_set():
+                started = time.perf_counter()
+                service.students.get_by_id(rnd.randint(1, 1000))
+                timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(seed,))
+                                                   for seed in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    ordered = sorted(latencies)
+    return {
+        'reads_per_sec': len(ordered) / seconds,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def bench_topology(students: int, readers: int, seconds: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_topology_shared.db')
+        populate(db_path, students)
+        pool = level3.ConnectionPool(db_path, max_size=readers + 1,
+                                     initializer=level3.DatabaseManager.prepare_connection)
+        results['общий пул, durable'] = _reads_under_writes(
+            lambda: level3.DatabaseManager(db_path, pool=pool, identity_map_size=0), readers, seconds
+        )
+        pool.close()
+
+        db_path = os.path.join(tmp, 'bench_topology_router.db')
+        populate(db_path, students)
+        router = level3.ConnectionRouter(db_path, readers=readers, profile='balanced')
+        results['писатель + читатели, WAL'] = _reads_under_writes(
+            lambda: level3.DatabaseManager(db_path, router=router, identity_map_size=0), readers, seconds
+        )
+        router.close()
+    return results
+
+
+# =============================================================================
+# СВОДНЫЙ НАБОР: методы репозиториев level1/level2/level3 на одинаковых данных
+# =============================================================================
+
+SUITE_OPERATIONS = (
+    'create', 'get_all', 'get_by_id', 'get_by_city', 'get_by_course',
+    'get_by_course_and_city', 'enroll', 'count', 'update', 'delete',
+)
+SUITE_COURSES = 20
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированным значениям"""
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def suite_stats(timings: List[float], rows: int) -> Dict[str, float]:
+    ordered = sorted(timings)
+    total = sum(timings)
+    return {
+        'calls': len(timings),
+        'mean_ms': total / len(timings) * 1000,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'rows': rows,
+        'rows_per_sec': rows / total if total else 0.0,
+    }
+
+
+def _result_rows(result) -> int:
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 0 if result is None or result is False else 1
+
+
+def _legacy_operations(module, db, size: int, rnd: random.Random) -> Dict[str, Optional[Callable]]:
+    """Операции level1/level2 (DatabaseManager с курсором, строки sqlite3.Row)"""
+    students = module.StudentRepository(db)
+    enrollments = module.EnrollmentRepository(db)
+    created: List[int] = []
+    to_enroll = iter(created)
+    to_delete = iter(created)
+
+    def create():
+        student = module.Student(name=rnd.choice(NAMES), surname=rnd.choice(SURNAMES),
+                                 age=rnd.randint(14, 80), city=rnd.choice(CITIES))
+        created.append(students.create(student))
+        return 1
+
+    def update():
+        student = module.Student(id=rnd.randint(1, size), name=rnd.choice(NAMES),
+                                 surname=rnd.choice(SURNAMES), age=rnd.randint(14, 80),
+                                 city=rnd.choice(CITIES))
+        return students.update(student)
+
+    by_course_and_city = getattr(students, 'get_by_course_and_city', None)
+    return {
+        'create': create,
+        'get_all': students.get_all,
+        'get_by_id': lambda: students.get_by_id(rnd.randint(1, size)),
+        'get_by_city': lambda: students.get_by_city(rnd.choice(CITIES)),
+        'get_by_course': lambda: students.get_by_course(f'course_{rnd.randint(1, SUITE_COURSES)}'),
+        'get_by_course_and_city': by_course_and_city and (
+            lambda: by_course_and_city(f'course_{rnd.randint(1, SUITE_COURSES)}', rnd.choice(CITIES))
+        ),
+        'enroll': lambda: enrollments.enroll(next(to_enroll), rnd.randint(1, SUITE_COURSES)),
+        'count': None,  # в level1/level2 нет метода count()
+        'update': update,
+        'delete': lambda: students.delete(next(to_delete)),
+    }
+
+
+def _level3_operations(service: level3.SchoolService, size: int,
+                       rnd: random.Random) -> Dict[str, Optional[Callable]]:
+    """Операции level3 (репозитории SchoolService, сущности Student)"""
+    students = service.students
+    created: List[int] = []
+    to_enroll = iter(created)
+    to_delete = iter(created)
+
+    def create():
+        student = level3.Student(name=rnd.choice(NAMES), surname=rnd.choice(SURNAMES),
+                                 age=rnd.randint(14, 80), city=rnd.choice(CITIES))
+        created.append(students.create(student))
+        return 1
+
+    def update():
+        student = level3.Student(id=rnd.randint(1, size), name=rnd.choice(NAMES),
+                                 surname=rnd.choice(SURNAMES), age=rnd.randint(14, 80),
+                                 city=rnd.choice(CITIES))
+        return students.update(student)
+
+    return {
+        'create': create,
+        'get_all': students.get_all,
+        'get_by_id': lambda: students.get_by_id(rnd.randint(1, size)),
+        'get_by_city': lambda: students.get_by_city(rnd.choice(CITIES)),
+        'get_by_course': lambda: students.get_by_course(f'course_{rnd.randint(1, SUITE_COURSES)}'),
+        'get_by_course_and_city': lambda: students.get_by_course_and_city(
+            f'course_{rnd.randint(1, SUITE_COURSES)}', rnd.choice(CITIES)
+        ),
+        'enroll': lambda: service.enrollments.enroll(next(to_enroll), rnd.randint(1, SUITE_COURSES)),
+        'count': students.count,
+        'update': update,
+        'delete': lambda: students.delete(next(to_delete)),
+    }
+
+
+def _run_operations(operations: Dict[str, Optional[Callable]],
+                    iterations: int) -> Dict[str, Optional[Dict[str, float]]]:
+    results = {}
+    for name in SUITE_OPERATIONS:
+        operation = operations.get(name)
+        if operation is None:
+            results[name] = None
+            continue
+        timings, rows = [], 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = operation()
+            timings.append(time.perf_counter() - started)
+            rows += _result_rows(result)
+        results[name] = suite_stats(timings, rows)
+    return results
+
+
+def bench_suite(sizes: List[int], iterations: int, seed: int) -> Dict[str, object]:
+    """Все методы репозиториев каждого уровня на одинаковых детерминированных данных"""
+    report = {
+        'meta': {
+            'seed': seed,
+            'sizes': sizes,
+            'iterations': iterations,
+            'courses': SUITE_COURSES,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {'level1': {}, 'level2': {}, 'level3': {}},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            base_path = os.path.join(tmp, f'suite_{size}.db')
+            populate(base_path, size, courses=SUITE_COURSES, seed=seed)
+
+            for level, module in (('level1', level1), ('level2', level2)):
+                db_path = os.path.join(tmp, f'suite_{size}_{level}.db')
+                shutil.copyfile(base_path, db_path)
+                with module.DatabaseManager(db_path) as db:
+                    operations = _legacy_operations(module, db, size, random.Random(seed))
+                    report['results'][level][str(size)] = _run_operations(operations, iterations)
+
+            db_path = os.path.join(tmp, f'suite_{size}_level3.db')
+            shutil.copyfile(base_path, db_path)
+            pool = level3.ConnectionPool(db_path, max_size=1,
+                                         initializer=level3.DatabaseManager.prepare_connection)
+            # Карта идентичности выключена: сравниваем стоимость запросов между уровнями
+            with level3.DatabaseManager(db_path, pool=pool, identity_map_size=0) as service:
+                operations = _level3_operations(service, size, random.Random(seed))
+                report['results']['level3'][str(size)] = _run_operations(operations, iterations)
+                service.commit()
+            pool.close()
+    return report
+
+
+def print_suite(report: Dict[str, object]) -> None:
+    for level, by_size in report['results'].items():
+        for size, operations in by_size.items():
+            rows = {name: {key: stats[key] for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rows_per_sec')}
+                    for name, stats in operations.items() if stats is not None}
+            print_table(f"{level}, {size} студентов", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки школьной ORM системы")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    connect = commands.add_parser('connect', help="задержка подключения к БД")
+    connect.add_argument('--iterations', type=int, default=500)
+
+    memory = commands.add_parser('memory', help="пиковая память при чтении всех студентов")
+    memory.add_argument('--students', type=int, default=200_000)
+    memory.add_argument('--batch-size', type=int, default=level3.DEFAULT_BATCH_SIZE)
+
+    entities = commands.add_parser('entities', help="скорость и память сборки сущностей из строк")
+    entities.add_argument('--students', type=int, default=200_000)
+    entities.add_argument('--repeat', type=int, default=5)
+
+    indexes = commands.add_parser('indexes', help="запросы до и после миграции индексов")
+    indexes.add_argument('--sizes', default='10000,100000,1000000')
+    indexes.add_argument('--iterations', type=int, default=5)
+
+    catalog = commands.add_parser('catalog', help="поиск студентов по названию курса: JOIN vs каталог")
+    catalog.add_argument('--sizes', default='10000,100000')
+    catalog.add_argument('--iterations', type=int, default=300)
+
+    group_commit = commands.add_parser('group-commit', help="параллельные create_student: коммит на вызов vs WriteQueue")
+    group_commit.add_argument('--threads', type=int, default=8)
+    group_commit.add_argument('--operations', type=int, default=200, help="вызовов на поток")
+    group_commit.add_argument('--max-batch', type=int, default=100)
+    group_commit.add_argument('--max-latency-ms', type=float, default=2.0)
+
+    topology = commands.add_parser('topology', help="чтения во время длинных транзакций записи")
+    topology.add_argument('--students', type=int, default=10_000)
+    topology.add_argument('--readers', type=int, default=4)
+    topology.add_argument('--seconds', type=float, default=3.0)
+
+    suite = commands.add_parser('suite', help="все методы репозиториев всех уровней, JSON-отчет")
+    suite.add_argument('--sizes', default='1000,10000')
+    suite.add_argument('--iterations', type=int, default=50)
+    suite.add_argument('--seed', type=int, default=42)
+    suite.add_argument('--output', default='benchmark_results.json')
+
+    args = parser.parse_args()
+
+    if args.command == 'connect':
+        print_table("Задержка подключения (мкс)", bench_connect(args.iterations))
+    elif args.command == 'memory':
+        print_table(f"Чтение {args.students} студентов (пик МБ, секунды)",
+                    bench_memory(args.students, args.batch_size))
+    elif args.command == 'entities':
+        print_table(f"Чтение {args.students} студентов (строк/с, байт на строку)",
+                    bench_entities(args.students, args.repeat))
+    elif args.command == 'indexes':
+        sizes = [int(size) for size in args.sizes.split(',')]
+        print_table("Медианная задержка запросов (мс)", bench_indexes(sizes, args.iterations))
+    elif args.command == 'catalog':
+        sizes = [int(size) for size in args.sizes.split(',')]
+        print_table("Медианная задержка поиска по курсу (мкс)", bench_catalog(sizes, args.iterations))
+    elif args.command == 'group-commit':
+        print_table(f"{args.threads} потоков x {args.operations} create_student",
+                    bench_group_commit(args.threads, args.operations, args.max_batch, args.max_latency_ms))
+    elif args.command == 'topology':
+        print_table(f"{args.readers} читателей во время записи",
+                    bench_topology(args.students, args.readers, args.seconds))
+    elif args.command == 'suite':
+        sizes = [int(size) for size in args.sizes.split(',')]
+        report = bench_suite(sizes, args.iterations, args.seed)
+        print_suite(report)
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
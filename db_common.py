@@ -0,0 +1,351 @@
+"""
+Общие для level1/level2/level3 средства работы с SQLite:
+профили производительности (PRAGMA), статистика запросов, журнал медленных запросов,
+каталог курсов и SQL массовой записи на курсы.
+"""
+
+import atexit
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Профили производительности: согласованный набор PRAGMA для каждого соединения.
+# durable   - настройки SQLite по умолчанию (fsync на каждый коммит); режим журнала
+#             хранится в файле БД и не меняется - WAL-файл остается WAL
+# balanced  - WAL + synchronous=NORMAL: быстрые коммиты, устойчивость к сбою процесса
+# bulk-read - большой кэш страниц и mmap для тяжелых читающих нагрузок
+PERFORMANCE_PROFILES = {
+    'durable': {
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+    'bulk-read': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -128000,
+        'mmap_size': 1024 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+PROFILE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def apply_profile(conn: sqlite3.Connection, profile: str) -> None:
+    """Применяет PRAGMA профиля к соединению (journal_mode первым)"""
+    if profile not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Неизвестный профиль '{profile}', доступны: {', '.join(PERFORMANCE_PROFILES)}")
+    for pragma, value in PERFORMANCE_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma} = {value}").fetchall()
+
+
+def read_pragmas(conn: sqlite3.Connection) -> dict:
+    """Фактические значения PRAGMA профиля на соединении"""
+    return {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in PROFILE_PRAGMAS}
+
+
+class QueryStats:
+    """Гистограммы задержек по отпечаткам запросов (потокобезопасно).
+    Для каждого отпечатка хранит количество вызовов, суммарное и максимальное время,
+    число возвращенных строк и последние SAMPLE_LIMIT замеров для перцентилей.
+    Отдельно считает все выполненные SQLite команды через trace callback.
+    """
+
+    SAMPLE_LIMIT = 1024
+    _LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _PARAM_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _SPACES = re.compile(r"\s+")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._traced = {}
+        self._fingerprints = {}
+
+    def fingerprint(self, sql: str) -> str:
+        """Нормализованный текст запроса: литералы и списки параметров заменены на ?"""
+        cached = self._fingerprints.get(sql)
+        if cached is None:
+            cached = self._LITERALS.sub('?', sql)
+            cached = self._PARAM_LISTS.sub('(?, ...)', cached)
+            cached = self._SPACES.sub(' ', cached).strip()
+            if len(self._fingerprints) < 4096:
+                self._fingerprints[sql] = cached
+        return cached
+
+    def record(self, key: str, seconds: float, rows: int = 0, kind: str = 'statement'):
+        """Добавляет замер; для kind='statement' ключ - текст SQL"""
+        if kind == 'statement':
+            key = self.fingerprint(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    'kind': kind, 'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0,
+                    'samples': deque(maxlen=self.SAMPLE_LIMIT),
+                }
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['rows'] += rows
+            if seconds > entry['max']:
+                entry['max'] = seconds
+            entry['samples'].append(seconds)
+
+    def trace(self, statement: str):
+        """Callback для sqlite3.Connection.set_trace_callback"""
+        key = self.fingerprint(statement)
+        with self._lock:
+            self._traced[key] = self._traced.get(key, 0) + 1
+
+    def snapshot(self) -> dict:
+        """Текущая статистика (отсортирована по суммарному времени)"""
+        with self._lock:
+            entries = [(key, dict(entry, samples=sorted(entry['samples'])))
+                       for key, entry in self._entries.items()]
+            traced = dict(self._traced)
+
+        def percentile(samples, q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+        timings = {}
+        for key, entry in sorted(entries, key=lambda item: item[1]['total'], reverse=True):
+            timings[key] = {
+                'kind': entry['kind'],
+                'count': entry['count'],
+                'total_ms': entry['total'] * 1000,
+                'p50_ms': percentile(entry['samples'], 0.50) * 1000,
+                'p95_ms': percentile(entry['samples'], 0.95) * 1000,
+                'max_ms': entry['max'] * 1000,
+                'rows': entry['rows'],
+            }
+        return {
+            'timings': timings,
+            'traced': dict(sorted(traced.items(), key=lambda item: item[1], reverse=True)),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._traced.clear()
+
+    def dump(self, path: Optional[str] = None):
+        """Сохраняет статистику в JSON-файл или печатает сводку, если путь не задан"""
+        data = self.snapshot()
+        if path:
+            with open(path, 'w', encoding='utf-8') as output:
+                json.dump(data, output, ensure_ascii=False, indent=2)
+            return
+        for key, entry in data['timings'].items():
+            print(f"{entry['count']:>8} {entry['total_ms']:>10.2f} мс  p95 {entry['p95_ms']:>8.3f} мс  {key}")
+
+    def dump_at_exit(self, path: Optional[str] = None):
+        """Регистрирует dump(path) на завершение процесса"""
+        atexit.register(self.dump, path)
+
+
+class SlowQueryLog:
+    """Журнал медленных запросов.
+    Запрос дольше threshold_ms логируется вместе с параметрами и выводом
+    EXPLAIN QUERY PLAN; полный SCAN таблиц WATCHED_TABLES помечается отдельно.
+    Последние записи доступны в entries. params=None - замер executemany:
+    набор строк не сохраняется, план строится с NULL вместо параметров.
+    """
+
+    WATCHED_TABLES = ('students', 'student_courses')
+    _TABLE_REFS = re.compile(r"\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+    _SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?")
+    _NOT_ALIASES = {'where', 'join', 'on', 'left', 'inner', 'cross', 'order', 'group',
+                    'limit', 'using', 'natural', 'outer', 'union', 'having', 'set'}
+
+    def __init__(self, threshold_ms: float = 100.0, logger: Optional[logging.Logger] = None,
+                 keep: int = 100):
+        self.threshold = threshold_ms / 1000
+        self.logger = logger or logging.getLogger(f"{__name__}.slow_queries")
+        self.entries = deque(maxlen=keep)
+
+    def check(self, conn: sqlite3.Connection, query: str, params, seconds: float):
+        if seconds >= self.threshold:
+            self.report(conn, query, params, seconds)
+
+    def full_scans(self, query: str, plan: List[str]) -> List[str]:
+        """Отслеживаемые таблицы, которые план читает полным SCAN (с учетом алиасов)"""
+        names = {}
+        for table, alias in self._TABLE_REFS.findall(query):
+            names[table.lower()] = table.lower()
+            if alias and alias.lower() not in self._NOT_ALIASES:
+                names[alias.lower()] = table.lower()
+        scans = []
+        for detail in plan:
+            match = self._SCAN.match(detail)
+            if match:
+                table = names.get(match.group(1).lower(), match.group(1).lower())
+                if table in self.WATCHED_TABLES and table not in scans:
+                    scans.append(table)
+        return scans
+
+    def report(self, conn: sqlite3.Connection, query: str, params, seconds: float):
+        bindings = params if params is not None else (None,) * query.count('?')
+        try:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, bindings)]
+        except sqlite3.Error as e:
+            plan = [f"EXPLAIN недоступен: {e}"]
+        scans = self.full_scans(query, plan)
+        entry = {
+            'sql': " ".join(query.split()),
+            'params': tuple(params) if params is not None else None,
+            'ms': seconds * 1000,
+            'plan': plan,
+            'full_scans': scans,
+        }
+        self.entries.append(entry)
+        self.logger.warning(
+            "Медленный запрос %.1f мс: %s | параметры: %r | план: %s%s",
+            entry['ms'], entry['sql'], entry['params'], "; ".join(plan),
+            f" | ПОЛНЫЙ SCAN: {', '.join(scans)}" if scans else ""
+        )
+
+
+class CourseCatalog:
+    """
+    Каталог курсов в памяти: name -> id и id -> строка курса (включается явно на каждом уровне).
+    Courses - маленькая и редко меняющаяся таблица: она читается целиком одним запросом,
+    а фильтр по названию курса превращается в фильтр по индексированному course_id без JOIN.
+    Выигрыша на индексированном Courses.name это почти не дает (см. benchmarks.py catalog).
+    Запись через это соединение видна сразу (total_changes); после отката владелец вызывает
+    invalidate(). Коммиты других соединений проверяются по PRAGMA data_version не чаще раза
+    в max_age секунд - чужие переименования и удаления видны с задержкой до max_age;
+    промах по названию проверяется всегда, поэтому новый курс виден сразу.
+    factory собирает результат get()/all() из строки (None - строка как есть).
+    """
+
+    def __init__(self, db_connection: sqlite3.Connection,
+                 factory: Optional[Callable[[Any], Any]] = None, max_age: float = 1.0):
+        self.db = db_connection
+        self.factory = factory
+        self.max_age = max_age
+        self._by_id: Dict[int, Any] = {}
+        self._by_name: Dict[str, int] = {}
+        self._version: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    def invalidate(self) -> None:
+        """Перечитать каталог при следующем обращении"""
+        self._version = None
+
+    def _refresh(self, recheck: bool = False) -> None:
+        now = time.monotonic()
+        if (self._version is not None and self._version[1] == self.db.total_changes
+                and not recheck and now - self._checked_at < self.max_age):
+            return
+        version = (self.db.execute("PRAGMA data_version").fetchone()[0], self.db.total_changes)
+        self._checked_at = now
+        if version == self._version:
+            return
+        rows = self.db.execute("SELECT id, name, time_start, time_end FROM Courses").fetchall()
+        self._by_id = {row[0]: row for row in rows}
+        self._by_name = {row[1]: row[0] for row in rows}
+        self._version = version
+        self.reloads += 1
+
+    def id_for(self, course_name: str) -> Optional[int]:
+        """ID курса по названию (None - курса нет)"""
+        self._refresh()
+        course_id = self._by_name.get(course_name)
+        if course_id is None:
+            self._refresh(recheck=True)
+            course_id = self._by_name.get(course_name)
+        return course_id
+
+    def get(self, course_id: int):
+        """Курс по ID из каталога (None - курса нет)"""
+        self._refresh()
+        row = self._by_id.get(course_id)
+        if row is None or self.factory is None:
+            return row
+        return self.factory(row)
+
+    def all(self) -> list:
+        """Все курсы каталога"""
+        self._refresh()
+        if self.factory is None:
+            return list(self._by_id.values())
+        return [self.factory(row) for row in self._by_id.values()]
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._by_id)
+
+
+@dataclass
+class EnrollmentReport:
+    """Итог массовой записи на курсы (пары student_id, course_id в порядке ввода)"""
+    inserted: int = 0
+    duplicates: List[Tuple[int, int]] = field(default_factory=list)
+    missing_students: List[Tuple[int, int]] = field(default_factory=list)
+    missing_courses: List[Tuple[int, int]] = field(default_factory=list)
+
+
+# Массовая запись на курсы (enroll_many): пары загружаются во временную таблицу одним
+# executemany, классифицируются тремя запросами и вставляются одним INSERT OR IGNORE ... SELECT -
+# без исключения IntegrityError на каждый дубликат
+ENROLL_STAGE_SETUP = (
+    "CREATE TEMP TABLE IF NOT EXISTS enroll_stage("
+    "pos INTEGER PRIMARY KEY, student_id INTEGER, course_id INTEGER)",
+    "CREATE INDEX IF NOT EXISTS temp.idx_enroll_stage ON enroll_stage(student_id, course_id, pos)",
+    "DELETE FROM temp.enroll_stage",
+)
+ENROLL_STAGE_INSERT = "INSERT INTO temp.enroll_stage (student_id, course_id) VALUES (?, ?)"
+ENROLL_MISSING_STUDENTS = '''
+    SELECT st.student_id, st.course_id FROM temp.enroll_stage st
+    WHERE NOT EXISTS (SELECT 1 FROM Students s WHERE s.id = st.student_id)
+    ORDER BY st.pos
+'''
+ENROLL_MISSING_COURSES = '''
+    SELECT st.student_id, st.course_id FROM temp.enroll_stage st
+    WHERE NOT EXISTS (SELECT 1 FROM Courses c WHERE c.id = st.course_id)
+    ORDER BY st.pos
+'''
+# Дубликат: пара уже есть в БД или повторяется во входных данных
+ENROLL_DUPLICATES = '''
+    SELECT st.student_id, st.course_id FROM temp.enroll_stage st
+    WHERE EXISTS (SELECT 1 FROM Students s WHERE s.id = st.student_id)
+      AND EXISTS (SELECT 1 FROM Courses c WHERE c.id = st.course_id)
+      AND (EXISTS (SELECT 1 FROM Student_Courses sc
+                   WHERE sc.student_id = st.student_id AND sc.course_id = st.course_id)
+           OR EXISTS (SELECT 1 FROM temp.enroll_stage prev
+                      WHERE prev.student_id = st.student_id
+                        AND prev.course_id = st.course_id AND prev.pos < st.pos))
+    ORDER BY st.pos
+'''
+# Дубликаты исключаются явно: в файлах старой схемы у Student_Courses нет PRIMARY KEY,
+# и OR IGNORE их бы не отбросил
+ENROLL_INSERT = '''
+    INSERT OR IGNORE INTO Student_Courses (student_id, course_id)
+    SELECT st.student_id, st.course_id FROM temp.enroll_stage st
+    JOIN Students s ON s.id = st.student_id
+    JOIN Courses c ON c.id = st.course_id
+    WHERE NOT EXISTS (SELECT 1 FROM Student_Courses sc
+                      WHERE sc.student_id = st.student_id AND sc.course_id = st.course_id)
+      AND NOT EXISTS (SELECT 1 FROM temp.enroll_stage prev
+                      WHERE prev.student_id = st.student_id
+                        AND prev.course_id = st.course_id AND prev.pos < st.pos)
+    ORDER BY st.pos
+'''
+ENROLL_STAGE_CLEAR = "DELETE FROM temp.enroll_stage"
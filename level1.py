@@ -29,9 +29,18 @@
 """
 
 import sqlite3
-from typing import List, Optional
+import time
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
 from dataclasses import dataclass
 
+from db_common import (
+    ENROLL_DUPLICATES, ENROLL_INSERT, ENROLL_MISSING_COURSES, ENROLL_MISSING_STUDENTS,
+    ENROLL_STAGE_CLEAR, ENROLL_STAGE_INSERT, ENROLL_STAGE_SETUP, PERFORMANCE_PROFILES,
+    CourseCatalog, EnrollmentReport, QueryStats, SlowQueryLog, apply_profile, read_pragmas,
+)
+
+
 @dataclass
 class Student:
     """Data class для представления студента
@@ -62,24 +71,52 @@ class Course:
     time_start: str = ""
     time_end: str = ""
 
+# Размер порции fetchmany для потоковых (iter_*) методов
+DEFAULT_BATCH_SIZE = 500
+
+
 class DatabaseManager:
     """Менеджер базы данных для обработки подключений и транзакций.
     Реализует контекстный менеджер для автоматического управления подключениями.
     Обеспечивает безопасное выполнение транзакций с автоматическим откатом при ошибках.
     Args:
         db_name: Имя файла базы данных (по умолчанию 'school.db')
+        profile: Профиль производительности из PERFORMANCE_PROFILES (по умолчанию 'durable')
+        stats: Экземпляр QueryStats - включает замеры запросов (None - выключено)
+        stats_path: Файл, в который статистика сохраняется при завершении процесса
+        slow_query_ms: Порог журнала медленных запросов в мс (None - журнал выключен)
+        course_catalog: Держать Courses в памяти и искать курсы по названию без JOIN
+            (по умолчанию выключен: выигрыша на индексированном Courses.name нет,
+            а чужие переименования и удаления курсов видны с задержкой до CourseCatalog.max_age)
     """
 
-    def __init__(self, db_name: str = 'school.db'):
+    def __init__(self, db_name: str = 'school.db', profile: str = 'durable',
+                 stats: Optional[QueryStats] = None, stats_path: Optional[str] = None,
+                 slow_query_ms: Optional[float] = None, course_catalog: bool = False):
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Неизвестный профиль '{profile}', доступны: {', '.join(PERFORMANCE_PROFILES)}")
         self.db_name = db_name
+        self.profile = profile
+        self.stats = stats
+        if stats is not None and stats_path:
+            stats.dump_at_exit(stats_path)
+        self.slow_log = SlowQueryLog(slow_query_ms) if slow_query_ms is not None else None
+        self._observed = stats is not None or self.slow_log is not None
         self.conn = None
         self.cursor = None
+        self.use_course_catalog = course_catalog
+        self.course_catalog = None
 
     def __enter__(self):
         """Вход в контекстный менеджер - устанавливает соединение с БД"""
         self.conn = sqlite3.connect(self.db_name)
         self.conn.row_factory = sqlite3.Row  # Возвращает результаты как словари
+        apply_profile(self.conn, self.profile)
+        if self.stats is not None:
+            self.conn.set_trace_callback(self.stats.trace)
         self.cursor = self.conn.cursor()
+        if self.use_course_catalog:
+            self.course_catalog = CourseCatalog(self.conn)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -95,22 +132,82 @@ class DatabaseManager:
                 self.conn.rollback()  # Откатываем при ошибке
             self.conn.close()
 
+    def _observe(self, query: str, params, seconds: float, rows: int = 0):
+        """Передает замер в QueryStats и журнал медленных запросов"""
+        if self.stats is not None:
+            self.stats.record(query, seconds, rows)
+        if self.slow_log is not None:
+            self.slow_log.check(self.conn, query, params, seconds)
+
     def execute(self, query: str, params: tuple = ()):
         """Выполняет SQL запрос с параметрами"""
-        return self.cursor.execute(query, params)
+        if not self._observed:
+            return self.cursor.execute(query, params)
+        started = time.perf_counter()
+        result = self.cursor.execute(query, params)
+        self._observe(query, params, time.perf_counter() - started)
+        return result
+
+    def execute_many(self, query: str, params_seq: Iterable[tuple]):
+        """Выполняет SQL запрос для каждого набора параметров (executemany)"""
+        if not self._observed:
+            return self.cursor.executemany(query, params_seq)
+        started = time.perf_counter()
+        result = self.cursor.executemany(query, params_seq)
+        self._observe(query, None, time.perf_counter() - started)
+        return result
+
+    def commit(self):
+        """Фиксирует текущую транзакцию, не закрывая соединение"""
+        self.conn.commit()
 
     def fetch_all(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
         """Выполняет запрос и возвращает все результаты"""
-        return self.cursor.execute(query, params).fetchall()
+        if not self._observed:
+            return self.cursor.execute(query, params).fetchall()
+        started = time.perf_counter()
+        rows = self.cursor.execute(query, params).fetchall()
+        self._observe(query, params, time.perf_counter() - started, len(rows))
+        return rows
+
+    def iter_all(self, query: str, params: tuple = (), batch_size: int = DEFAULT_BATCH_SIZE):
+        """Выполняет запрос и отдает строки по одной, подкачивая их порциями fetchmany.
+        Использует отдельный курсор, чтобы другие запросы во время итерации не сбивали выборку.
+        """
+        cursor = self.conn.cursor()
+        if not self._observed:
+            cursor.execute(query, params)
+        else:
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            self._observe(query, params, time.perf_counter() - started)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
 
     def fetch_one(self, query: str, params: tuple = ()):
         """Выполняет запрос и возвращает один результат (первую строку)"""
-        return self.cursor.execute(query, params).fetchone()
+        if not self._observed:
+            return self.cursor.execute(query, params).fetchone()
+        started = time.perf_counter()
+        row = self.cursor.execute(query, params).fetchone()
+        self._observe(query, params, time.perf_counter() - started, 0 if row is None else 1)
+        return row
 
     def execute_script(self, script: str):
         """Выполняет SQL скрипт, содержащий несколько команд"""
         self.cursor.executescript(script)
 
+    def diagnostics(self) -> dict:
+        """Активный профиль и фактические значения его PRAGMA"""
+        return {
+            'db_name': self.db_name,
+            'profile': self.profile,
+            'pragmas': read_pragmas(self.conn) if self.conn else None,
+        }
+
 
 class StudentRepository:
     """Репозиторий для операций со студентами в базе данных.
@@ -119,9 +216,35 @@ class StudentRepository:
         db_manager: Экземпляр DatabaseManager для работы с БД
     """
 
+    BY_COURSE_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        JOIN Courses c ON sc.course_id = c.id
+        WHERE c.name = ?
+    '''
+    # С каталогом курсов название заранее переводится в id, и Courses в запросе не нужна:
+    # фильтр идет по индексированному Student_courses.course_id
+    BY_COURSE_ID_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ?
+    '''
+
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
+    def _course_query(self, course_name: str, by_name: str, by_id: str):
+        """Запрос по курсу и значение его первого параметра: без каталога - JOIN по названию,
+        с каталогом - id курса. None - курса нет в каталоге
+        """
+        catalog = self.db.course_catalog
+        if catalog is None:
+            return by_name, course_name
+        course_id = catalog.id_for(course_name)
+        return (by_id, course_id) if course_id is not None else None
+
     def create(self, student: Student) -> int:
         """Создает нового студента в базе данных
         Args:
@@ -133,6 +256,30 @@ class StudentRepository:
         result = self.db.execute(query, (student.name, student.surname, student.age, student.city))
         return result.lastrowid
 
+    def create_many(self, students: Iterable[Student], chunk_size: int = 1000) -> List[int]:
+        """Массово создает студентов через executemany.
+        Входные данные читаются порциями по chunk_size (можно передать генератор),
+        каждая порция вставляется одним executemany и фиксируется своей транзакцией.
+        Args:
+            students: Итерируемый набор объектов Student
+            chunk_size: Размер порции (строк на транзакцию)
+        Returns:
+            ID созданных студентов в порядке входных данных
+        """
+        query = "INSERT INTO Students (name, surname, age, city) VALUES (?, ?, ?, ?)"
+        ids = []
+        students = iter(students)
+        while True:
+            rows = [(s.name, s.surname, s.age, s.city) for s in islice(students, chunk_size)]
+            if not rows:
+                break
+            self.db.execute_many(query, rows)
+            # В пределах одной транзакции id выдаются подряд
+            last_id = self.db.fetch_one("SELECT last_insert_rowid()")[0]
+            ids.extend(range(last_id - len(rows) + 1, last_id + 1))
+            self.db.commit()
+        return ids
+
     def get_all(self) -> List[sqlite3.Row]:
         """Получает список всех студентов"""
         return self.db.fetch_all("SELECT * FROM Students")
@@ -163,14 +310,27 @@ class StudentRepository:
         Returns:
             Список студентов на указанном курсе
         """
-        query = '''
-            SELECT s.* 
-            FROM Students s
-            JOIN Student_courses sc ON s.id = sc.student_id
-            JOIN Courses c ON sc.course_id = c.id
-            WHERE c.name = ?
-        '''
-        return self.db.fetch_all(query, (course_name,))
+        prepared = self._course_query(course_name, self.BY_COURSE_QUERY, self.BY_COURSE_ID_QUERY)
+        if prepared is None:
+            return []
+        query, course = prepared
+        return self.db.fetch_all(query, (course,))
+
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает всех студентов (порциями по batch_size)"""
+        return self.db.iter_all("SELECT * FROM Students", (), batch_size)
+
+    def iter_by_city(self, city: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов из указанного города"""
+        return self.db.iter_all("SELECT * FROM Students WHERE city = ?", (city,), batch_size)
+
+    def iter_by_course(self, course_name: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов, записанных на указанный курс"""
+        prepared = self._course_query(course_name, self.BY_COURSE_QUERY, self.BY_COURSE_ID_QUERY)
+        if prepared is None:
+            return iter(())
+        query, course = prepared
+        return self.db.iter_all(query, (course,), batch_size)
 
     def update(self, student: Student) -> bool:
         """Обновляет данные существующего студента
@@ -212,12 +372,30 @@ class CourseRepository:
         """
         query = "INSERT INTO Courses (name, time_start, time_end) VALUES (?, ?, ?)"
         result = self.db.execute(query, (course.name, course.time_start, course.time_end))
+        if self.catalog is not None:
+            self.catalog.invalidate()
         return result.lastrowid
 
+    @property
+    def catalog(self) -> Optional[CourseCatalog]:
+        """Общий для соединения каталог курсов (None - выключен)"""
+        return self.db.course_catalog
+
+    def get_by_name(self, course_name: str):
+        """Находит курс по названию (через каталог, если он включен)"""
+        if self.catalog is None:
+            return self.db.fetch_one("SELECT * FROM Courses WHERE name = ?", (course_name,))
+        course_id = self.catalog.id_for(course_name)
+        return self.catalog.get(course_id) if course_id is not None else None
+
     def get_all(self) -> List[sqlite3.Row]:
         """Получает список всех курсов"""
         return self.db.fetch_all("SELECT * FROM Courses")
 
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает все курсы"""
+        return self.db.iter_all("SELECT * FROM Courses", (), batch_size)
+
     def get_by_id(self, course_id: int):
         """Находит курс по его ID
         Args:
@@ -234,6 +412,13 @@ class EnrollmentRepository:
         db_manager: Экземпляр DatabaseManager для работы с БД
     """
 
+    COURSE_STUDENTS_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ?
+    '''
+
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
@@ -255,6 +440,28 @@ class EnrollmentRepository:
             # Происходит если запись уже существует или нарушаются foreign key constraints
             return False
 
+    def enroll_many(self, pairs: Iterable[Tuple[int, int]]) -> EnrollmentReport:
+        """Массово записывает студентов на курсы (без коммита).
+        Пары загружаются во временную таблицу одним executemany и вставляются одним
+        INSERT OR IGNORE ... SELECT - вместо INSERT и перехвата IntegrityError на каждую пару.
+        Args:
+            pairs: Итерируемый набор пар (student_id, course_id)
+        Returns:
+            EnrollmentReport: число вставленных записей, дубликаты и пары
+            с несуществующим студентом или курсом (в порядке входных данных)
+        """
+        for statement in ENROLL_STAGE_SETUP:
+            self.db.execute(statement)
+        self.db.execute_many(ENROLL_STAGE_INSERT, pairs)
+
+        report = EnrollmentReport()
+        report.missing_students = [tuple(row) for row in self.db.fetch_all(ENROLL_MISSING_STUDENTS)]
+        report.missing_courses = [tuple(row) for row in self.db.fetch_all(ENROLL_MISSING_COURSES)]
+        report.duplicates = [tuple(row) for row in self.db.fetch_all(ENROLL_DUPLICATES)]
+        report.inserted = self.db.execute(ENROLL_INSERT).rowcount
+        self.db.execute(ENROLL_STAGE_CLEAR)
+        return report
+
     def get_course_students(self, course_id: int) -> List[sqlite3.Row]:
         """Получает всех студентов, записанных на указанный курс
         Args:
@@ -262,13 +469,11 @@ class EnrollmentRepository:
         Returns:
             Список студентов на курсе
         """
-        query = '''
-            SELECT s.* 
-            FROM Students s
-            JOIN Student_courses sc ON s.id = sc.student_id
-            WHERE sc.course_id = ?
-        '''
-        return self.db.fetch_all(query, (course_id,))
+        return self.db.fetch_all(self.COURSE_STUDENTS_QUERY, (course_id,))
+
+    def iter_course_students(self, course_id: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов, записанных на указанный курс"""
+        return self.db.iter_all(self.COURSE_STUDENTS_QUERY, (course_id,), batch_size)
 
 class SchoolSystem:
     """Основной класс системы управления школой.
@@ -287,6 +492,7 @@ class SchoolSystem:
         - Courses: информация о курсах
         - Student_courses: таблица связей многие-ко-многим.
         Использует каскадное удаление для поддержания целостности данных.
+        Создает индексы idx_students_city, idx_students_age и idx_student_courses_course.
         """
         with DatabaseManager(self.db_name) as db:
             db.execute_script('''
@@ -315,6 +521,15 @@ class SchoolSystem:
                     FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
                     PRIMARY KEY (student_id, course_id)
                 );
+
+                -- Вторичные индексы для фильтров по городу/возрасту и выборок со стороны курса.
+                -- (course_id, student_id) - покрывающий индекс: первичный ключ начинается со student_id
+                -- и не помогает при поиске по course_id. IF NOT EXISTS делает скрипт миграцией
+                -- для уже существующих файлов.
+                CREATE INDEX IF NOT EXISTS idx_students_city ON Students(city);
+                CREATE INDEX IF NOT EXISTS idx_students_age ON Students(age);
+                CREATE INDEX IF NOT EXISTS idx_student_courses_course
+                    ON Student_courses(course_id, student_id);
             ''')
         print(f"База данных {self.db_name} инициализирована")
 
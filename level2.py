@@ -33,9 +33,18 @@
 """
 
 import sqlite3
-from typing import List, Optional
+import time
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
 from dataclasses import dataclass
 
+from db_common import (
+    ENROLL_DUPLICATES, ENROLL_INSERT, ENROLL_MISSING_COURSES, ENROLL_MISSING_STUDENTS,
+    ENROLL_STAGE_CLEAR, ENROLL_STAGE_INSERT, ENROLL_STAGE_SETUP, PERFORMANCE_PROFILES,
+    CourseCatalog, EnrollmentReport, QueryStats, SlowQueryLog, apply_profile, read_pragmas,
+)
+
+
 @dataclass
 class Student:
     """Data class для представления студента
@@ -67,24 +76,52 @@ class Course:
     time_start: str = ""
     time_end: str = ""
 
+# Размер порции fetchmany для потоковых (iter_*) методов
+DEFAULT_BATCH_SIZE = 500
+
+
 class DatabaseManager:
     """Менеджер базы данных для обработки подключений и транзакций.
     Реализует контекстный менеджер для автоматического управления подключениями
     и обеспечения целостности транзакций.
     Args:
         db_name: Имя файла базы данных (по умолчанию 'school.db')
+        profile: Профиль производительности из PERFORMANCE_PROFILES (по умолчанию 'durable')
+        stats: Экземпляр QueryStats - включает замеры запросов (None - выключено)
+        stats_path: Файл, в который статистика сохраняется при завершении процесса
+        slow_query_ms: Порог журнала медленных запросов в мс (None - журнал выключен)
+        course_catalog: Держать Courses в памяти и искать курсы по названию без JOIN
+            (по умолчанию выключен: выигрыша на индексированном Courses.name нет,
+            а чужие переименования и удаления курсов видны с задержкой до CourseCatalog.max_age)
     """
 
-    def __init__(self, db_name: str = 'school.db'):
+    def __init__(self, db_name: str = 'school.db', profile: str = 'durable',
+                 stats: Optional[QueryStats] = None, stats_path: Optional[str] = None,
+                 slow_query_ms: Optional[float] = None, course_catalog: bool = False):
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Неизвестный профиль '{profile}', доступны: {', '.join(PERFORMANCE_PROFILES)}")
         self.db_name = db_name
+        self.profile = profile
+        self.stats = stats
+        if stats is not None and stats_path:
+            stats.dump_at_exit(stats_path)
+        self.slow_log = SlowQueryLog(slow_query_ms) if slow_query_ms is not None else None
+        self._observed = stats is not None or self.slow_log is not None
         self.conn = None
         self.cursor = None
+        self.use_course_catalog = course_catalog
+        self.course_catalog = None
 
     def __enter__(self):
         """Вход в контекстный менеджер - устанавливает соединение с БД"""
         self.conn = sqlite3.connect(self.db_name)
         self.conn.row_factory = sqlite3.Row  # Возвращает результаты как словари
+        apply_profile(self.conn, self.profile)
+        if self.stats is not None:
+            self.conn.set_trace_callback(self.stats.trace)
         self.cursor = self.conn.cursor()
+        if self.use_course_catalog:
+            self.course_catalog = CourseCatalog(self.conn)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -99,22 +136,82 @@ class DatabaseManager:
                 self.conn.rollback()  # Откатываем при ошибке
             self.conn.close()
 
+    def _observe(self, query: str, params, seconds: float, rows: int = 0):
+        """Передает замер в QueryStats и журнал медленных запросов"""
+        if self.stats is not None:
+            self.stats.record(query, seconds, rows)
+        if self.slow_log is not None:
+            self.slow_log.check(self.conn, query, params, seconds)
+
     def execute(self, query: str, params: tuple = ()):
         """Выполняет SQL запрос с параметрами"""
-        return self.cursor.execute(query, params)
+        if not self._observed:
+            return self.cursor.execute(query, params)
+        started = time.perf_counter()
+        result = self.cursor.execute(query, params)
+        self._observe(query, params, time.perf_counter() - started)
+        return result
+
+    def execute_many(self, query: str, params_seq: Iterable[tuple]):
+        """Выполняет SQL запрос для каждого набора параметров (executemany)"""
+        if not self._observed:
+            return self.cursor.executemany(query, params_seq)
+        started = time.perf_counter()
+        result = self.cursor.executemany(query, params_seq)
+        self._observe(query, None, time.perf_counter() - started)
+        return result
+
+    def commit(self):
+        """Фиксирует текущую транзакцию, не закрывая соединение"""
+        self.conn.commit()
 
     def fetch_all(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
         """Выполняет запрос и возвращает все результаты"""
-        return self.cursor.execute(query, params).fetchall()
+        if not self._observed:
+            return self.cursor.execute(query, params).fetchall()
+        started = time.perf_counter()
+        rows = self.cursor.execute(query, params).fetchall()
+        self._observe(query, params, time.perf_counter() - started, len(rows))
+        return rows
+
+    def iter_all(self, query: str, params: tuple = (), batch_size: int = DEFAULT_BATCH_SIZE):
+        """Выполняет запрос и отдает строки по одной, подкачивая их порциями fetchmany.
+        Использует отдельный курсор, чтобы другие запросы во время итерации не сбивали выборку.
+        """
+        cursor = self.conn.cursor()
+        if not self._observed:
+            cursor.execute(query, params)
+        else:
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            self._observe(query, params, time.perf_counter() - started)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
 
     def fetch_one(self, query: str, params: tuple = ()):
         """Выполняет запрос и возвращает один результат (первую строку)"""
-        return self.cursor.execute(query, params).fetchone()
+        if not self._observed:
+            return self.cursor.execute(query, params).fetchone()
+        started = time.perf_counter()
+        row = self.cursor.execute(query, params).fetchone()
+        self._observe(query, params, time.perf_counter() - started, 0 if row is None else 1)
+        return row
 
     def execute_script(self, script: str):
         """Выполняет SQL скрипт, содержащий несколько команд"""
         self.cursor.executescript(script)
 
+    def diagnostics(self) -> dict:
+        """Активный профиль и фактические значения его PRAGMA"""
+        return {
+            'db_name': self.db_name,
+            'profile': self.profile,
+            'pragmas': read_pragmas(self.conn) if self.conn else None,
+        }
+
 class StudentRepository:
     """Репозиторий для расширенных операций со студентами.
     Добавлены новые методы фильтрации для выполнения сложных запросов.
@@ -122,15 +219,78 @@ class StudentRepository:
         db_manager: Экземпляр DatabaseManager для работы с БД
     """
 
+    BY_COURSE_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        JOIN Courses c ON sc.course_id = c.id
+        WHERE c.name = ?
+    '''
+    # С каталогом курсов название заранее переводится в id, и Courses в запросе не нужна:
+    # фильтр идет по индексированному Student_courses.course_id
+    BY_COURSE_ID_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ?
+    '''
+    BY_COURSE_AND_CITY_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        JOIN Courses c ON sc.course_id = c.id
+        WHERE c.name = ? AND s.city = ?
+    '''
+    BY_COURSE_ID_AND_CITY_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ? AND s.city = ?
+    '''
+
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
+    def _course_query(self, course_name: str, by_name: str, by_id: str):
+        """Запрос по курсу и значение его первого параметра: без каталога - JOIN по названию,
+        с каталогом - id курса. None - курса нет в каталоге
+        """
+        catalog = self.db.course_catalog
+        if catalog is None:
+            return by_name, course_name
+        course_id = catalog.id_for(course_name)
+        return (by_id, course_id) if course_id is not None else None
+
     def create(self, student: Student) -> int:
         """Создает нового студента в базе данных"""
         query = "INSERT INTO Students (name, surname, age, city) VALUES (?, ?, ?, ?)"
         result = self.db.execute(query, (student.name, student.surname, student.age, student.city))
         return result.lastrowid
 
+    def create_many(self, students: Iterable[Student], chunk_size: int = 1000) -> List[int]:
+        """Массово создает студентов через executemany.
+        Входные данные читаются порциями по chunk_size (можно передать генератор),
+        каждая порция вставляется одним executemany и фиксируется своей транзакцией.
+        Args:
+            students: Итерируемый набор объектов Student
+            chunk_size: Размер порции (строк на транзакцию)
+        Returns:
+            ID созданных студентов в порядке входных данных
+        """
+        query = "INSERT INTO Students (name, surname, age, city) VALUES (?, ?, ?, ?)"
+        ids = []
+        students = iter(students)
+        while True:
+            rows = [(s.name, s.surname, s.age, s.city) for s in islice(students, chunk_size)]
+            if not rows:
+                break
+            self.db.execute_many(query, rows)
+            # В пределах одной транзакции id выдаются подряд
+            last_id = self.db.fetch_one("SELECT last_insert_rowid()")[0]
+            ids.extend(range(last_id - len(rows) + 1, last_id + 1))
+            self.db.commit()
+        return ids
+
     def get_all(self) -> List[sqlite3.Row]:
         """Получает список всех студентов"""
         return self.db.fetch_all("SELECT * FROM Students")
@@ -156,14 +316,11 @@ class StudentRepository:
         """Находит всех студентов, записанных на указанный курс.
         Выполняет JOIN через таблицу связей Student_courses.
         """
-        query = '''
-            SELECT s.* 
-            FROM Students s
-            JOIN Student_courses sc ON s.id = sc.student_id
-            JOIN Courses c ON sc.course_id = c.id
-            WHERE c.name = ?
-        '''
-        return self.db.fetch_all(query, (course_name,))
+        prepared = self._course_query(course_name, self.BY_COURSE_QUERY, self.BY_COURSE_ID_QUERY)
+        if prepared is None:
+            return []
+        query, course = prepared
+        return self.db.fetch_all(query, (course,))
 
     def get_by_course_and_city(self, course_name: str, city: str) -> List[sqlite3.Row]:
         """Находит студентов на курсе из указанного города
@@ -175,14 +332,42 @@ class StudentRepository:
         Returns:
             Список студентов, удовлетворяющих обоим условиям
         """
-        query = '''
-            SELECT s.* 
-            FROM Students s
-            JOIN Student_courses sc ON s.id = sc.student_id
-            JOIN Courses c ON sc.course_id = c.id
-            WHERE c.name = ? AND s.city = ?
-        '''
-        return self.db.fetch_all(query, (course_name, city))
+        prepared = self._course_query(course_name, self.BY_COURSE_AND_CITY_QUERY,
+                                      self.BY_COURSE_ID_AND_CITY_QUERY)
+        if prepared is None:
+            return []
+        query, course = prepared
+        return self.db.fetch_all(query, (course, city))
+
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает всех студентов (порциями по batch_size)"""
+        return self.db.iter_all("SELECT * FROM Students", (), batch_size)
+
+    def iter_by_city(self, city: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов из указанного города"""
+        return self.db.iter_all("SELECT * FROM Students WHERE city = ?", (city,), batch_size)
+
+    def iter_by_age_gt(self, age: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов старше указанного возраста"""
+        return self.db.iter_all("SELECT * FROM Students WHERE age > ?", (age,), batch_size)
+
+    def iter_by_course(self, course_name: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов, записанных на указанный курс"""
+        prepared = self._course_query(course_name, self.BY_COURSE_QUERY, self.BY_COURSE_ID_QUERY)
+        if prepared is None:
+            return iter(())
+        query, course = prepared
+        return self.db.iter_all(query, (course,), batch_size)
+
+    def iter_by_course_and_city(self, course_name: str, city: str,
+                                batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов на курсе из указанного города"""
+        prepared = self._course_query(course_name, self.BY_COURSE_AND_CITY_QUERY,
+                                      self.BY_COURSE_ID_AND_CITY_QUERY)
+        if prepared is None:
+            return iter(())
+        query, course = prepared
+        return self.db.iter_all(query, (course, city), batch_size)
 
     def update(self, student: Student) -> bool:
         """Обновляет данные существующего студента"""
@@ -205,12 +390,30 @@ class CourseRepository:
         """Создает новый курс в базе данных"""
         query = "INSERT INTO Courses (name, time_start, time_end) VALUES (?, ?, ?)"
         result = self.db.execute(query, (course.name, course.time_start, course.time_end))
+        if self.catalog is not None:
+            self.catalog.invalidate()
         return result.lastrowid
 
+    @property
+    def catalog(self) -> Optional[CourseCatalog]:
+        """Общий для соединения каталог курсов (None - выключен)"""
+        return self.db.course_catalog
+
+    def get_by_name(self, course_name: str):
+        """Находит курс по названию (через каталог, если он включен)"""
+        if self.catalog is None:
+            return self.db.fetch_one("SELECT * FROM Courses WHERE name = ?", (course_name,))
+        course_id = self.catalog.id_for(course_name)
+        return self.catalog.get(course_id) if course_id is not None else None
+
     def get_all(self) -> List[sqlite3.Row]:
         """Получает список всех курсов"""
         return self.db.fetch_all("SELECT * FROM Courses")
 
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает все курсы"""
+        return self.db.iter_all("SELECT * FROM Courses", (), batch_size)
+
     def get_by_id(self, course_id: int):
         """Находит курс по его ID"""
         return self.db.fetch_one("SELECT * FROM Courses WHERE id = ?", (course_id,))
@@ -219,6 +422,13 @@ class CourseRepository:
 class EnrollmentRepository:
     """Репозиторий для управления записями студентов на курсы"""
 
+    COURSE_STUDENTS_QUERY = '''
+        SELECT s.* 
+        FROM Students s
+        JOIN Student_courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ?
+    '''
+
     def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
@@ -237,15 +447,35 @@ class EnrollmentRepository:
             # Происходит если запись уже существует
             return False
 
+    def enroll_many(self, pairs: Iterable[Tuple[int, int]]) -> EnrollmentReport:
+        """Массово записывает студентов на курсы (без коммита).
+        Пары загружаются во временную таблицу одним executemany и вставляются одним
+        INSERT OR IGNORE ... SELECT - вместо INSERT и перехвата IntegrityError на каждую пару.
+        Args:
+            pairs: Итерируемый набор пар (student_id, course_id)
+        Returns:
+            EnrollmentReport: число вставленных записей, дубликаты и пары
+            с несуществующим студентом или курсом (в порядке входных данных)
+        """
+        for statement in ENROLL_STAGE_SETUP:
+            self.db.execute(statement)
+        self.db.execute_many(ENROLL_STAGE_INSERT, pairs)
+
+        report = EnrollmentReport()
+        report.missing_students = [tuple(row) for row in self.db.fetch_all(ENROLL_MISSING_STUDENTS)]
+        report.missing_courses = [tuple(row) for row in self.db.fetch_all(ENROLL_MISSING_COURSES)]
+        report.duplicates = [tuple(row) for row in self.db.fetch_all(ENROLL_DUPLICATES)]
+        report.inserted = self.db.execute(ENROLL_INSERT).rowcount
+        self.db.execute(ENROLL_STAGE_CLEAR)
+        return report
+
     def get_course_students(self, course_id: int) -> List[sqlite3.Row]:
         """Получает всех студентов, записанных на указанный курс"""
-        query = '''
-            SELECT s.* 
-            FROM Students s
-            JOIN Student_courses sc ON s.id = sc.student_id
-            WHERE sc.course_id = ?
-        '''
-        return self.db.fetch_all(query, (course_id,))
+        return self.db.fetch_all(self.COURSE_STUDENTS_QUERY, (course_id,))
+
+    def iter_course_students(self, course_id: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоково перебирает студентов, записанных на указанный курс"""
+        return self.db.iter_all(self.COURSE_STUDENTS_QUERY, (course_id,), batch_size)
 
 class SchoolSystem:
     """Расширенный класс системы управления школой
@@ -262,6 +492,8 @@ class SchoolSystem:
         - Students: информация о студентах с проверкой возраста
         - Courses: информация о курсах с уникальными названиями
         - Student_courses: таблица связей с каскадным удалением
+        А также индексы по Students.city, Students.age и покрывающий
+        (course_id, student_id) для выборок со стороны курса.
         """
         with DatabaseManager(self.db_name) as db:
             db.execute_script('''
@@ -287,6 +519,11 @@ class SchoolSystem:
                     FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
                     PRIMARY KEY (student_id, course_id)
                 );
+
+                CREATE INDEX IF NOT EXISTS idx_students_city ON Students(city);
+                CREATE INDEX IF NOT EXISTS idx_students_age ON Students(age);
+                CREATE INDEX IF NOT EXISTS idx_student_courses_course
+                    ON Student_courses(course_id, student_id);
             ''')
         print(f"База данных {self.db_name} инициализирована")
 
@@ -315,11 +552,10 @@ class SchoolSystem:
             ]
 
             # Используем прямой SQL для вставки с явными ID
-            for course in courses_data:
-                db.execute(
-                    "INSERT INTO Courses (id, name, time_start, time_end) VALUES (?, ?, ?, ?)",
-                    (course.id, course.name, course.time_start, course.time_end)
-                )
+            db.execute_many(
+                "INSERT INTO Courses (id, name, time_start, time_end) VALUES (?, ?, ?, ?)",
+                ((c.id, c.name, c.time_start, c.time_end) for c in courses_data)
+            )
 
             # Создание студентов с различными характеристиками для демонстрации фильтрации
             students_data = [
@@ -329,11 +565,10 @@ class SchoolSystem:
                 Student(id=4, name='Kate', surname='Brooks', age=34, city='Spb')
             ]
 
-            for student in students_data:
-                db.execute(
-                    "INSERT INTO Students (id, name, surname, age, city) VALUES (?, ?, ?, ?, ?)",
-                    (student.id, student.name, student.surname, student.age, student.city)
-                )
+            db.execute_many(
+                "INSERT INTO Students (id, name, surname, age, city) VALUES (?, ?, ?, ?, ?)",
+                ((s.id, s.name, s.surname, s.age, s.city) for s in students_data)
+            )
 
             # Создание связей студентов с курсами
             # Распределение специально подобрано для демонстрации запросов
@@ -344,11 +579,10 @@ class SchoolSystem:
                 (4, 2)  # Kate (34 года, Spb) на java
             ]
 
-            for student_id, course_id in enrollments_data:
-                db.execute(
-                    "INSERT INTO Student_courses (student_id, course_id) VALUES (?, ?)",
-                    (student_id, course_id)
-                )
+            db.execute_many(
+                "INSERT INTO Student_courses (student_id, course_id) VALUES (?, ?)",
+                enrollments_data
+            )
 
             print("Данные уровня 2 добавлены в базу")
 
@@ -6,11 +6,30 @@
 School ORM System - Компактная версия с правильными транзакциями
 """
 
+import argparse
+import asyncio
+import re
 import sqlite3
 import os
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import List, Optional, Dict, Any, Callable, Iterable, Union, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
+from functools import partial, wraps
+from pathlib import Path
+
+from db_common import (
+    ENROLL_DUPLICATES, ENROLL_INSERT, ENROLL_MISSING_COURSES, ENROLL_MISSING_STUDENTS,
+    ENROLL_STAGE_CLEAR, ENROLL_STAGE_INSERT, ENROLL_STAGE_SETUP, PERFORMANCE_PROFILES,
+    CourseCatalog, EnrollmentReport, QueryStats, SlowQueryLog, apply_profile, read_pragmas,
+)
+
 
 # =============================================================================
 # ИСКЛЮЧЕНИЯ
@@ -28,13 +47,40 @@ class DatabaseError(Exception):
 # СЛОЙ СУЩНОСТЕЙ
 # =============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class Student:
+    # Маска измененных колонок (бит на колонку COLUMNS). Поле первое: __init__ выставляет
+    # его до колонок, и новый объект (не из БД) целиком считается измененным
+    _dirty: int = field(default=0b1111, init=False, repr=False, compare=False)
     id: Optional[int] = None
     name: str = ""
     surname: str = ""
     age: int = 0
     city: str = ""
+    # Курсы студента, None - связь не загружалась (см. get_all_with_courses)
+    courses: Optional[List['Course']] = field(default=None, repr=False, compare=False)
+
+    COLUMNS = ('name', 'surname', 'age', 'city')
+    _COLUMN_BITS = dict(zip(COLUMNS, (1, 2, 4, 8)))
+    # Порядок колонок в SELECT для from_tuple
+    SELECT_COLUMNS = "id, name, surname, age, city"
+
+    @property
+    def dirty_fields(self) -> Tuple[str, ...]:
+        """Колонки, измененные после загрузки, в порядке COLUMNS"""
+        return tuple(column for column, bit in self._COLUMN_BITS.items() if self._dirty & bit)
+
+    def __setattr__(self, name, value):
+        # Присваивание того же значения колонку не меняет
+        bit = self._COLUMN_BITS.get(name)
+        if bit is not None and not self._dirty & bit and getattr(self, name) != value:
+            object.__setattr__(self, '_dirty', self._dirty | bit)
+        object.__setattr__(self, name, value)
+
+    def mark_clean(self) -> 'Student':
+        """Состояние совпадает с БД (после загрузки или сохранения)"""
+        self._dirty = 0
+        return self
 
     def _post_init_(self):
         """Валидация данных студента"""
@@ -55,15 +101,39 @@ class Student:
             surname=row['surname'],
             age=row['age'],
             city=row['city']
-        )
+        ).mark_clean()
 
+    @classmethod
+    def from_tuple(cls, row: tuple) -> 'Student':
+        """
+        Быстрый путь: позиционная сборка из кортежа (SELECT_COLUMNS) без sqlite3.Row.
+        Слоты заполняются напрямую, мимо __init__ и __setattr__; объект сразу чистый.
+        """
+        student = _new_entity(cls)
+        for set_slot, value in zip(_STUDENT_ROW_SLOTS, row):
+            set_slot(student, value)
+        _set_student_dirty(student, 0)
+        _set_student_courses(student, None)
+        return student
 
-@dataclass
+
+# Дескрипторы слотов Student для from_tuple (в порядке SELECT_COLUMNS)
+_new_entity = object.__new__
+_STUDENT_ROW_SLOTS = tuple(Student.__dict__[name].__set__ for name in ('id',) + Student.COLUMNS)
+_set_student_dirty = Student.__dict__['_dirty'].__set__
+_set_student_courses = Student.__dict__['courses'].__set__
+
+
+@dataclass(slots=True)
 class Course:
     id: Optional[int] = None
     name: str = ""
     time_start: str = ""
     time_end: str = ""
+    # Студенты курса, None - связь не загружалась (см. get_all_with_students)
+    students: Optional[List[Student]] = field(default=None, repr=False, compare=False)
+
+    SELECT_COLUMNS = "id, name, time_start, time_end"
 
     def _post_init_(self):
         """Валидация данных курса"""
@@ -82,94 +152,961 @@ class Course:
             time_end=row['time_end']
         )
 
+    @classmethod
+    def from_tuple(cls, row: tuple) -> 'Course':
+        """Быстрый путь: позиционная сборка из кортежа (SELECT_COLUMNS) без sqlite3.Row"""
+        return cls(*row)
+
+@dataclass
+class StudentPage:
+    """Страница keyset-пагинации: next_after_id передается в следующий вызов page()"""
+    items: List[Student]
+    next_after_id: Optional[int]
+    has_more: bool
+
+# Результаты агрегатных отчетов (ReportRepository)
+
+@dataclass(frozen=True, slots=True)
+class CourseEnrollment:
+    """Число записей на курс"""
+    course_id: int
+    name: str
+    students: int
+
+@dataclass(frozen=True, slots=True)
+class CityCount:
+    """Число студентов в городе"""
+    city: str
+    students: int
+
+@dataclass(frozen=True, slots=True)
+class CourseCityCount:
+    """Строка сводки Course_City_Roster: студенты курса из одного города"""
+    course_id: int
+    city: str
+    students: int
+
+@dataclass(frozen=True, slots=True)
+class AgeBucket:
+    """Интервал гистограммы возрастов [age_from, age_to]"""
+    age_from: int
+    age_to: int
+    students: int
+
+@dataclass(frozen=True, slots=True)
+class CourseAgeStats:
+    """Средний возраст студентов курса (None - на курс никто не записан)"""
+    course_id: int
+    name: str
+    students: int
+    average_age: Optional[float]
+
+@dataclass(frozen=True, slots=True)
+class CoursesPerStudent:
+    """Сколько студентов записано ровно на courses курсов"""
+    courses: int
+    students: int
+
+# =============================================================================
+# ИНСТРУМЕНТИРОВАНИЕ
+# =============================================================================
+
+def instrumented(method):
+    """Замер метода репозитория (ключ 'Класс.метод'); без stats - прямой вызов"""
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.stats is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        self.stats.record(name, time.perf_counter() - started, rows, kind='method')
+        return result
+
+    return wrapper
+
 # =============================================================================
 # СЛОЙ РЕПОЗИТОРИЕВ
 # =============================================================================
 
-class StudentRepository:
-    def __init__(self, db_connection: sqlite3.Connection):
+# Размер порции fetchmany для потоковых (iter_*) методов
+DEFAULT_BATCH_SIZE = 500
+
+# UPDATE/DELETE ... RETURNING доступны начиная с SQLite 3.35
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Операторы, перед которыми sqlite3 неявно выполняет BEGIN
+_DML = re.compile(r"^\s*(?:INSERT|REPLACE|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+def stream_rows(cursor: sqlite3.Cursor, factory: Optional[Callable[[Any], Any]],
+                batch_size: int = DEFAULT_BATCH_SIZE):
+    """Отдает объекты (или сами строки без factory) по одной, подкачивая строки порциями fetchmany"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        if factory is None:
+            yield from rows
+        else:
+            for row in rows:
+                yield factory(row)
+
+
+class IdentityMap:
+    """
+    Карта идентичности сессии: одна сущность на (класс, id), LRU с ограничением max_size.
+    Повторный get_by_id возвращает тот же объект без обращения к SQLite.
+    Очищается сервисом на commit/rollback.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._entities = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, entity_type: type, entity_id: int):
+        key = (entity_type, entity_id)
+        entity = self._entities.get(key)
+        if entity is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entities.move_to_end(key)
+        return entity
+
+    def put(self, entity):
+        key = (type(entity), entity.id)
+        self._entities[key] = entity
+        self._entities.move_to_end(key)
+        if len(self._entities) > self.max_size:
+            self._entities.popitem(last=False)
+        return entity
+
+    def discard(self, entity_type: type, entity_id: int):
+        self._entities.pop((entity_type, entity_id), None)
+
+    def clear(self):
+        self._entities.clear()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+
+class QueryCache:
+    """
+    Read-through LRU-кэш результатов чтения репозиториев (включается явно).
+    Ключ - (SQL, параметры); хранятся строки-кортежи, сущности собираются заново
+    на каждое попадание, поэтому изменение полученных объектов кэш не портит.
+    Вытеснение по числу записей и приблизительному объему в байтах.
+    Инвалидация: запись через репозитории сбрасывает записи затронутых таблиц
+    (с учетом триггеров и каскадов) в момент коммита, коммиты других процессов
+    (PRAGMA data_version) - весь кэш. Запись в обход репозиториев на том же
+    соединении кэш не видит.
+    Изоляция сессий: внутри открытой транзакции кэш не читается и не пополняется -
+    иначе другие сессии увидели бы незакоммиченные данные, а сама сессия после коммита
+    получила бы значения, закэшированные до него. Коммит увеличивает поколение кэша:
+    результат, загруженный до коммита, а сохраняемый после, отбрасывается.
+    """
+
+    CACHEABLE_TABLES = frozenset({
+        'students', 'courses', 'student_courses', 'table_counters', 'course_city_roster',
+    })
+    # Таблицы, которые меняются вместе с записью в ключевую (триггеры, ON DELETE CASCADE)
+    DEPENDENT_TABLES = {
+        'students': ('student_courses', 'table_counters', 'course_city_roster'),
+        'courses': ('student_courses', 'table_counters', 'course_city_roster'),
+        'student_courses': ('table_counters', 'course_city_roster'),
+    }
+    _READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+((?:\w+\.)?\w+)", re.IGNORECASE)
+    _WRITE_TARGETS = re.compile(
+        r"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+        r"\s+(?:\w+\.)?(\w+)", re.IGNORECASE
+    )
+    _READ = re.compile(r"^\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # ключ -> (строки, таблицы, байты)
+        self._by_table: Dict[str, set] = {}
+        self._bytes = 0
+        self._versions: Dict[int, int] = {}  # id соединения -> PRAGMA data_version
+        self._pending: Dict[int, set] = {}  # id соединения -> таблицы, измененные в открытой транзакции
+        self._generation = 0
+        self._statements: Dict[str, Tuple[str, frozenset]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def classify(self, sql: str) -> Tuple[str, frozenset]:
+        """('read', таблицы) - кэшируемое чтение, ('write', таблицы) - запись, ('other', ...)"""
+        kind = self._statements.get(sql)
+        if kind is None:
+            targets = self._WRITE_TARGETS.findall(sql)
+            if targets:
+                tables = set()
+                for table in targets:
+                    table = table.lower()
+                    tables.add(table)
+                    tables.update(self.DEPENDENT_TABLES.get(table, ()))
+                kind = ('write', frozenset(tables))
+            elif self._READ.match(sql):
+                tables = frozenset(table.lower() for table in self._READ_TABLES.findall(sql))
+                # временные таблицы и запросы без таблиц (last_insert_rowid()) не кэшируются
+                kind = ('read', tables) if tables and tables <= self.CACHEABLE_TABLES else ('other', frozenset())
+            else:
+                kind = ('other', frozenset())
+            if len(self._statements) < 4096:
+                self._statements[sql] = kind
+        return kind
+
+    def read_through(self, conn: sqlite3.Connection, sql: str, params,
+                     loader: Callable[[str, Any], Any], one: bool = False):
+        """Результат loader(sql, params) из кэша или из БД; записи инвалидируют кэш"""
+        kind, tables = self.classify(sql)
+        if kind != 'read':
+            result = loader(sql, params)
+            if kind == 'write':
+                self.invalidate_written(conn, tables)
+            return result
+        if conn.in_transaction:
+            return loader(sql, params)
+        try:
+            key = (sql, tuple(params), one)
+            hash(key)
+        except TypeError:
+            return loader(sql, params)
+
+        self._check_version(conn)
+        with self._lock:
+            cached = self._entries.get(key, self._MISSING)
+            if cached is not self._MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = cached[0]
+                return list(result) if isinstance(result, list) else result
+            self.misses += 1
+            generation = self._generation
+        result = loader(sql, params)
+        self._store(key, tables, result, generation)
+        return list(result) if isinstance(result, list) else result
+
+    def invalidate(self, tables: Iterable[str]):
+        """Сброс записей, читающих любую из таблиц"""
+        with self._lock:
+            for table in tables:
+                for key in self._by_table.pop(table, ()):
+                    self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_statement(self, conn: sqlite3.Connection, sql: str):
+        kind, tables = self.classify(sql)
+        if kind == 'write':
+            self.invalidate_written(conn, tables)
+
+    def invalidate_written(self, conn: sqlite3.Connection, tables: Iterable[str]):
+        """Запись в транзакции откладывает инвалидацию до commit(), в autocommit - сразу"""
+        if conn.in_transaction:
+            with self._lock:
+                self._pending.setdefault(id(conn), set()).update(tables)
+            return
+        with self._lock:
+            self._generation += 1
+        self.invalidate(tables)
+
+    def commit(self, conn: sqlite3.Connection):
+        """Вызывается после коммита conn: сброс таблиц, измененных транзакцией"""
+        with self._lock:
+            tables = self._pending.pop(id(conn), None)
+            self._generation += 1
+        if tables:
+            self.invalidate(tables)
+
+    def rollback(self, conn: sqlite3.Connection):
+        """Вызывается после отката conn: отложенные инвалидации больше не нужны"""
+        with self._lock:
+            self._pending.pop(id(conn), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                'entries': len(self._entries), 'bytes': self._bytes,
+            }
+
+    def _check_version(self, conn: sqlite3.Connection):
+        """Коммит другого соединения меняет data_version - кэш целиком устарел"""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._lock:
+            previous = self._versions.get(id(conn))
+            self._versions[id(conn)] = version
+        if previous != version:
+            # первое чтение через соединение тоже сбрасывает кэш: чужие коммиты до него неизвестны
+            self.clear()
+
+    @staticmethod
+    def _estimate(result) -> int:
+        """Приблизительный объем результата: средний размер первых строк * число строк"""
+        rows = result if isinstance(result, list) else [result] if result is not None else []
+        sample = rows[:16]
+        if not sample:
+            return sys.getsizeof(rows)
+        per_row = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+                      for row in sample) / len(sample)
+        return sys.getsizeof(rows) + int(per_row * len(rows))
+
+    def _store(self, key, tables: frozenset, result, generation: int):
+        size = self._estimate(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return  # пока результат загружался, закоммитили запись - он мог устареть
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, tables, size)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        for table in entry[1]:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+
+class BaseRepository:
+    """Выполнение запросов для репозиториев (замеры - при переданном QueryStats,
+    журнал медленных запросов - при переданном SlowQueryLog, кэш чтений - при QueryCache)"""
+
+    def __init__(self, db_connection: sqlite3.Connection, stats: Optional[QueryStats] = None,
+                 slow_log: Optional[SlowQueryLog] = None, query_cache: Optional[QueryCache] = None):
         self.db = db_connection
+        self.stats = stats
+        self.slow_log = slow_log
+        self.query_cache = query_cache
+        self._observed = stats is not None or slow_log is not None
+        # Подключается SchoolService; None - каждый get_by_id идет в БД
+        self.identity_map: Optional[IdentityMap] = None
+        # Подключается SchoolService; None - название курса ищется JOIN с Courses
+        self.catalog: Optional[CourseCatalog] = None
+        # Выставляет SchoolService: соединение роутера mode=ro, запись вне transaction() запрещена
+        self.readonly = False
+
+    def _observe(self, query: str, params, seconds: float, rows: int = 0):
+        if self.stats is not None:
+            self.stats.record(query, seconds, rows)
+        if self.slow_log is not None:
+            self.slow_log.check(self.db, query, params, seconds)
+
+    def _cursor(self, query: str) -> sqlite3.Cursor:
+        """Курсор без row_factory: строки - кортежи, сущности собираются позиционно (from_tuple)"""
+        # Запись на mode=ro упала бы уже после неявного BEGIN, и сессия застряла бы на старом снимке
+        if self.readonly and _DML.match(query):
+            raise DatabaseError("Сессия роутера пишет только внутри transaction(): "
+                                "вне ее соединение открыто только для чтения")
+        cursor = self.db.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    def _execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        cursor = self._cursor(query)
+        if not self._observed:
+            cursor.execute(query, params)
+        else:
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            self._observe(query, params, time.perf_counter() - started)
+        if self.query_cache is not None:
+            self.query_cache.invalidate_statement(self.db, query)
+        return cursor
+
+    def _execute_many(self, query: str, params_seq: Iterable[tuple]) -> sqlite3.Cursor:
+        cursor = self._cursor(query)
+        if not self._observed:
+            cursor.executemany(query, params_seq)
+        else:
+            started = time.perf_counter()
+            cursor.executemany(query, params_seq)
+            self._observe(query, None, time.perf_counter() - started)
+        if self.query_cache is not None:
+            self.query_cache.invalidate_statement(self.db, query)
+        return cursor
+
+    def _query_all(self, query: str, params: tuple = ()) -> list:
+        cursor = self._cursor(query)
+        if not self._observed:
+            return cursor.execute(query, params).fetchall()
+        started = time.perf_counter()
+        rows = cursor.execute(query, params).fetchall()
+        self._observe(query, params, time.perf_counter() - started, len(rows))
+        return rows
+
+    def _query_one(self, query: str, params: tuple = ()):
+        cursor = self._cursor(query)
+        if not self._observed:
+            return cursor.execute(query, params).fetchone()
+        started = time.perf_counter()
+        row = cursor.execute(query, params).fetchone()
+        self._observe(query, params, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def _fetch_all(self, query: str, params: tuple = (),
+                   factory: Optional[Callable[[Any], Any]] = None) -> list:
+        if self.query_cache is None:
+            rows = self._query_all(query, params)
+        else:
+            rows = self.query_cache.read_through(self.db, query, params, self._query_all)
+        return [factory(row) for row in rows] if factory else rows
+
+    def _fetch_one(self, query: str, params: tuple = (),
+                   factory: Optional[Callable[[Any], Any]] = None):
+        if self.query_cache is None:
+            row = self._query_one(query, params)
+        else:
+            row = self.query_cache.read_through(self.db, query, params, self._query_one, one=True)
+        return factory(row) if factory and row is not None else row
+
+    def _stream(self, query: str, params: tuple, factory: Optional[Callable[[Any], Any]],
+                batch_size: int = DEFAULT_BATCH_SIZE):
+        return stream_rows(self._execute(query, params), factory, batch_size)
+
+    @contextmanager
+    def _snapshot(self):
+        """Несколько SELECT в одной читающей транзакции - коммит другого соединения между ними не виден"""
+        if self.db.in_transaction:
+            yield
+            return
+        self.db.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self.db.commit()
+
 
+class StudentQuery:
+    """
+    Ленивый цепочечный запрос к Students:
+        students.filter(city='Spb', age__gt=30).in_course('python')
+    Компилируется в один параметризованный SELECT и выполняется только при итерации.
+    Скомпилированный SQL кэшируется по "форме" запроса (поля, операторы, число параметров).
+    """
+
+    FIELDS = ('id', 'name', 'surname', 'age', 'city')
+    SELECT = "s.id, s.name, s.surname, s.age, s.city"
+    LOOKUPS = {
+        'exact': '=', 'ne': '!=',
+        'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=',
+        'in': 'IN',
+    }
+    # Сравнение с NULL через = и != не совпадает ни с одной строкой: None в exact/ne
+    # компилируется в IS NULL / IS NOT NULL без параметра
+    _NULL_LOOKUPS = {'exact': 'isnull', 'ne': 'notnull'}
+    _NULL_OPERATORS = {'isnull': 'IS NULL', 'notnull': 'IS NOT NULL'}
+    _sql_cache: Dict[tuple, str] = {}
+    _SQL_CACHE_LIMIT = 512  # защита от роста кэша при разных длинах списков IN
+
+    def __init__(self, repository: BaseRepository):
+        self.repository = repository
+        self._conditions: Tuple[Tuple[str, str, Any], ...] = ()
+        self._courses: Tuple[str, ...] = ()
+        self._order: Tuple[str, ...] = ()
+        self._limit: Optional[int] = None
+        self._factory: Optional[Callable[[Any], Any]] = Student.from_tuple
+
+    def _clone(self) -> 'StudentQuery':
+        clone = StudentQuery.__new__(StudentQuery)
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    def filter(self, **conditions) -> 'StudentQuery':
+        """Условия вида поле=значение или поле__оператор=значение (объединяются через AND)"""
+        parsed = []
+        for key, value in conditions.items():
+            name, _, lookup = key.partition('__')
+            lookup = lookup or 'exact'
+            if name not in self.FIELDS:
+                raise ValueError(f"Неизвестное поле '{name}'")
+            if lookup not in self.LOOKUPS:
+                raise ValueError(f"Неизвестный оператор '{lookup}'")
+            if lookup == 'in':
+                value = tuple(value)
+                if None in value:
+                    raise ValueError(f"None в '{key}' не совпадет ни с одной строкой")
+            elif value is None:
+                if lookup not in self._NULL_LOOKUPS:
+                    raise ValueError(f"Оператор '{lookup}' не применим к None")
+                lookup = self._NULL_LOOKUPS[lookup]
+            parsed.append((name, lookup, value))
+        clone = self._clone()
+        clone._conditions = self._conditions + tuple(parsed)
+        return clone
+
+    def in_course(self, course_name: str) -> 'StudentQuery':
+        """Только студенты, записанные на курс с указанным названием"""
+        clone = self._clone()
+        clone._courses = self._courses + (course_name,)
+        return clone
+
+    def order_by(self, *fields: str) -> 'StudentQuery':
+        """Сортировка; префикс '-' (один) означает по убыванию"""
+        for name in fields:
+            column = name[1:] if name.startswith('-') else name
+            if column not in self.FIELDS:
+                raise ValueError(f"Неизвестное поле '{column}'")
+        clone = self._clone()
+        clone._order = tuple(fields)
+        return clone
+
+    def limit(self, count: int) -> 'StudentQuery':
+        clone = self._clone()
+        clone._limit = count
+        return clone
+
+    def tuples(self) -> 'StudentQuery':
+        """Результат - кортежи (id, name, surname, age, city) без создания Student"""
+        clone = self._clone()
+        clone._factory = None
+        return clone
+
+    def _shape(self) -> tuple:
+        return (
+            tuple((name, lookup, len(value) if lookup == 'in' else None)
+                  for name, lookup, value in self._conditions),
+            len(self._courses),
+            self._order,
+            self._limit is not None,
+            self.repository.catalog is not None,
+        )
+
+    def _where(self, shape: tuple) -> str:
+        conditions, courses_count, _, _, by_catalog = shape
+        clauses = []
+        for name, lookup, size in conditions:
+            if lookup == 'in':
+                clauses.append(f"s.{name} IN ({', '.join('?' * size)})")
+            elif lookup in self._NULL_OPERATORS:
+                clauses.append(f"s.{name} {self._NULL_OPERATORS[lookup]}")
+            else:
+                clauses.append(f"s.{name} {self.LOOKUPS[lookup]} ?")
+        if by_catalog:
+            # Название уже переведено в id каталогом - только индекс Student_Courses.course_id
+            course_clause = "s.id IN (SELECT sc.student_id FROM Student_Courses sc WHERE sc.course_id = ?)"
+        else:
+            course_clause = ("s.id IN (SELECT sc.student_id FROM Student_Courses sc "
+                             "JOIN Courses c ON c.id = sc.course_id WHERE c.name = ?)")
+        clauses.extend([course_clause] * courses_count)
+        return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def _compile(self, select: str = SELECT) -> Tuple[str, tuple]:
+        """SQL (из кэша по форме запроса) и параметры"""
+        shape = self._shape()
+        key = (select, shape)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            sql = f"SELECT {select} FROM Students s" + self._where(shape)
+            if select == self.SELECT:
+                if self._order:
+                    sql += " ORDER BY " + ", ".join(
+                        f"s.{name[1:]} DESC" if name.startswith('-') else f"s.{name}"
+                        for name in self._order
+                    )
+                if self._limit is not None:
+                    sql += " LIMIT ?"
+            if len(self._sql_cache) >= self._SQL_CACHE_LIMIT:
+                self._sql_cache.clear()
+            self._sql_cache[key] = sql
+
+        params: List[Any] = []
+        for _, lookup, value in self._conditions:
+            if lookup == 'in':
+                params.extend(value)
+            elif lookup not in self._NULL_OPERATORS:
+                params.append(value)
+        catalog = self.repository.catalog
+        if catalog is not None:
+            # Неизвестный курс дает course_id = NULL - условие не совпадет ни с одной строкой
+            params.extend(catalog.id_for(name) for name in self._courses)
+        else:
+            params.extend(self._courses)
+        if select == self.SELECT and self._limit is not None:
+            params.append(self._limit)
+        return sql, tuple(params)
+
+    def iter(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        """Потоковое выполнение: строки подкачиваются порциями по batch_size"""
+        sql, params = self._compile()
+        return self.repository._stream(sql, params, self._factory, batch_size)
+
+    def __iter__(self):
+        return self.iter()
+
+    def all(self) -> List[Student]:
+        sql, params = self._compile()
+        return self.repository._fetch_all(sql, params, self._factory)
+
+    def first(self) -> Optional[Student]:
+        sql, params = self.limit(1)._compile()
+        return self.repository._fetch_one(sql, params, self._factory)
+
+    def count(self) -> int:
+        sql, params = self._compile("COUNT(*)")
+        return self.repository._fetch_one(sql, params)[0]
+
+    def exists(self) -> bool:
+        return self.first() is not None
+
+
+class StudentRepository(BaseRepository):
+    # False - запасной путь для старых сборок SQLite (запись + отдельный SELECT)
+    use_returning = SUPPORTS_RETURNING
+
+    @instrumented
     def create(self, student: Student) -> int:
         """Создание студента БЕЗ коммита"""
-        cursor = self.db.cursor()
-        cursor.execute(
+        cursor = self._execute(
             "INSERT INTO Students (name, surname, age, city) VALUES (?, ?, ?, ?)",
             (student.name, student.surname, student.age, student.city)
         )
         return cursor.lastrowid
 
-    def get_all(self) -> List[Student]:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT * FROM Students")
-        return [Student.from_row(row) for row in cursor.fetchall()]
-
+    @instrumented
+    def create_many(self, students: Iterable[Student]) -> List[int]:
+        """
+        Массовое создание студентов одним executemany БЕЗ коммита.
+        Принимает генератор: строки подаются в SQLite по одной, без промежуточного списка.
+        Возвращает ID в порядке входных данных.
+        """
+        cursor = self._execute_many(
+            "INSERT INTO Students (name, surname, age, city) VALUES (?, ?, ?, ?)",
+            ((s.name, s.surname, s.age, s.city) for s in students)
+        )
+        inserted = cursor.rowcount
+        if inserted <= 0:
+            return []
+        # В пределах одной транзакции id выдаются подряд
+        last_id = self._fetch_one("SELECT last_insert_rowid()")[0]
+        return list(range(last_id - inserted + 1, last_id + 1))
+
+    @instrumented
+    def get_all(self, raw: bool = False) -> List[Student]:
+        """raw=True - кортежи (id, name, surname, age, city) вместо Student"""
+        return self._fetch_all(f"SELECT {Student.SELECT_COLUMNS} FROM Students", (),
+                               None if raw else Student.from_tuple)
+
+    @instrumented
+    def get_all_with_courses(self) -> List[Student]:
+        """
+        Все студенты с заполненным списком courses - два запроса независимо от числа студентов.
+        Один и тот же курс представлен одним объектом Course.
+        """
+        with self._snapshot():
+            students = self.get_all()
+            # JOIN Students: связи без студента (файлы level1/level2 пишутся без foreign_keys) пропускаются
+            links = self._fetch_all('''
+                SELECT sc.student_id, c.id, c.name, c.time_start, c.time_end FROM Student_Courses sc
+                JOIN Students s ON s.id = sc.student_id
+                JOIN Courses c ON c.id = sc.course_id
+                ORDER BY sc.student_id, c.id
+            ''')
+        by_id = {}
+        for student in students:
+            student.courses = []
+            by_id[student.id] = student
+        courses = {}
+        for row in links:
+            student = by_id.get(row[0])
+            if student is None:
+                continue
+            course = courses.get(row[1])
+            if course is None:
+                course = courses[row[1]] = Course.from_tuple(row[1:])
+            student.courses.append(course)
+        return students
+
+    @instrumented
     def get_by_id(self, student_id: int) -> Optional[Student]:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT * FROM Students WHERE id = ?", (student_id,))
-        row = cursor.fetchone()
-        return Student.from_row(row) if row else None
+        if self.identity_map is not None:
+            student = self.identity_map.get(Student, student_id)
+            if student is not None:
+                return student
+        student = self._fetch_one(f"SELECT {Student.SELECT_COLUMNS} FROM Students WHERE id = ?",
+                                  (student_id,), Student.from_tuple)
+        if student is not None and self.identity_map is not None:
+            self.identity_map.put(student)
+        return student
+
+    def query(self) -> StudentQuery:
+        """Пустой ленивый запрос (все студенты)"""
+        return StudentQuery(self)
+
+    def filter(self, **conditions) -> StudentQuery:
+        return self.query().filter(**conditions)
+
+    def in_course(self, course_name: str) -> StudentQuery:
+        return self.query().in_course(course_name)
+
+    @instrumented
+    def get_by_city(self, city: str) -> List[Student]:
+        return self.filter(city=city).all()
+
+    @instrumented
+    def get_by_age_gt(self, age: int) -> List[Student]:
+        return self.filter(age__gt=age).all()
+
+    @instrumented
+    def get_by_course(self, course_name: str) -> List[Student]:
+        return self.in_course(course_name).all()
+
+    @instrumented
+    def get_by_course_and_city(self, course_name: str, city: str) -> List[Student]:
+        return self.filter(city=city).in_course(course_name).all()
+
+    @instrumented
+    def page(self, after_id: int = 0, limit: int = 20) -> StudentPage:
+        """
+        Keyset-пагинация по первичному ключу: WHERE id > after_id ORDER BY id LIMIT.
+        Стоимость O(limit) на любой глубине, в отличие от OFFSET.
+        """
+        items = self._fetch_all(
+            f"SELECT {Student.SELECT_COLUMNS} FROM Students WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit + 1),  # лишняя строка показывает, есть ли следующая страница
+            Student.from_tuple
+        )
+        has_more = len(items) > limit
+        items = items[:limit]
+        return StudentPage(
+            items=items,
+            next_after_id=items[-1].id if items else None,
+            has_more=has_more,
+        )
+
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE, raw: bool = False):
+        """Потоковый перебор всех студентов без материализации списка (raw=True - кортежи)"""
+        return self._stream(f"SELECT {Student.SELECT_COLUMNS} FROM Students", (),
+                            None if raw else Student.from_tuple, batch_size)
 
+    def iter_by_city(self, city: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        return self.filter(city=city).iter(batch_size)
+
+    def iter_by_course(self, course_name: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        return self.in_course(course_name).iter(batch_size)
+
+    @instrumented
     def update(self, student: Student) -> bool:
+        """
+        Записывает только измененные после загрузки колонки.
+        Без изменений запрос не выполняется (True - строка уже в нужном состоянии).
+        """
         if student.id is None:
             raise ValueError("Нельзя обновить студента без ID")
-        cursor = self.db.cursor()
-        cursor.execute(
-            "UPDATE Students SET name = ?, surname = ?, age = ?, city = ? WHERE id = ?",
-            (student.name, student.surname, student.age, student.city, student.id)
+        columns = student.dirty_fields
+        if not columns:
+            return True
+        cursor = self._execute(
+            f"UPDATE Students SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+            tuple(getattr(student, column) for column in columns) + (student.id,)
         )
-        return cursor.rowcount > 0
-
+        updated = cursor.rowcount > 0
+        if updated:
+            student.mark_clean()
+            if self.identity_map is not None:
+                self.identity_map.put(student)
+        return updated
+
+    @instrumented
+    def update_returning(self, student_id: int, changes: Dict[str, Any]) -> Optional[Student]:
+        """
+        Обновление без предварительного чтения: UPDATE ... RETURNING отдает
+        итоговую строку, None - студента нет. Сущность из карты идентичности
+        обновляется через update() (только измененные колонки).
+        """
+        changes = {column: value for column, value in changes.items() if column in Student.COLUMNS}
+        cached = self.identity_map.get(Student, student_id) if self.identity_map is not None else None
+        if cached is not None:
+            for column, value in changes.items():
+                setattr(cached, column, value)
+            return cached if self.update(cached) else None
+        if not changes:
+            return self.get_by_id(student_id)
+
+        assignments = ', '.join(f'{column} = ?' for column in changes)
+        params = tuple(changes.values()) + (student_id,)
+        if self.use_returning:
+            student = self._fetch_one(
+                f"UPDATE Students SET {assignments} WHERE id = ? RETURNING {Student.SELECT_COLUMNS}",
+                params, Student.from_tuple
+            )
+        else:
+            if self._execute(f"UPDATE Students SET {assignments} WHERE id = ?", params).rowcount == 0:
+                return None
+            student = self._fetch_one(f"SELECT {Student.SELECT_COLUMNS} FROM Students WHERE id = ?",
+                                      (student_id,), Student.from_tuple)
+        if student is not None and self.identity_map is not None:
+            self.identity_map.put(student)
+        return student
+
+    @instrumented
+    def delete_returning(self, student_id: int) -> Optional[Student]:
+        """Удаление одним DELETE ... RETURNING; возвращает удаленного студента или None"""
+        if self.use_returning:
+            student = self._fetch_one(
+                f"DELETE FROM Students WHERE id = ? RETURNING {Student.SELECT_COLUMNS}",
+                (student_id,), Student.from_tuple
+            )
+        else:
+            student = self._fetch_one(f"SELECT {Student.SELECT_COLUMNS} FROM Students WHERE id = ?",
+                                      (student_id,), Student.from_tuple)
+            if student is not None:
+                self._execute("DELETE FROM Students WHERE id = ?", (student_id,))
+        if self.identity_map is not None:
+            self.identity_map.discard(Student, student_id)
+        return student
+
+    @instrumented
     def delete(self, student_id: int) -> bool:
-        cursor = self.db.cursor()
-        cursor.execute("DELETE FROM Students WHERE id = ?", (student_id,))
+        cursor = self._execute("DELETE FROM Students WHERE id = ?", (student_id,))
+        if self.identity_map is not None:
+            self.identity_map.discard(Student, student_id)
         return cursor.rowcount > 0
 
+    @instrumented
     def count(self) -> int:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM Students")
-        return cursor.fetchone()['count']
+        """Число студентов из Table_Counters - O(1) вместо обхода таблицы"""
+        return self._fetch_one("SELECT row_count FROM Table_Counters WHERE name = 'Students'")[0]
 
 
-class CourseRepository:
-    def __init__(self, db_connection: sqlite3.Connection):
-        self.db = db_connection
-
+class CourseRepository(BaseRepository):
+    @instrumented
     def create(self, course: Course) -> int:
         """Создание курса БЕЗ коммита"""
-        cursor = self.db.cursor()
-        cursor.execute(
+        cursor = self._execute(
             "INSERT INTO Courses (name, time_start, time_end) VALUES (?, ?, ?)",
             (course.name, course.time_start, course.time_end)
         )
+        if self.catalog is not None:
+            self.catalog.invalidate()
         return cursor.lastrowid
 
-    def get_all(self) -> List[Course]:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT * FROM Courses")
-        return [Course.from_row(row) for row in cursor.fetchall()]
+    @instrumented
+    def get_all(self, raw: bool = False) -> List[Course]:
+        """raw=True - кортежи (id, name, time_start, time_end) вместо Course"""
+        return self._fetch_all(f"SELECT {Course.SELECT_COLUMNS} FROM Courses", (),
+                               None if raw else Course.from_tuple)
+
+    def iter_all(self, batch_size: int = DEFAULT_BATCH_SIZE, raw: bool = False):
+        return self._stream(f"SELECT {Course.SELECT_COLUMNS} FROM Courses", (),
+                            None if raw else Course.from_tuple, batch_size)
 
+    @instrumented
+    def get_all_with_students(self) -> List[Course]:
+        """
+        Все курсы с заполненным списком students - два запроса независимо от числа курсов.
+        Студент, записанный на несколько курсов, представлен одним объектом Student.
+        """
+        with self._snapshot():
+            courses = self.get_all()
+            # JOIN Courses: связи без курса (файлы level1/level2 пишутся без foreign_keys) пропускаются
+            links = self._fetch_all('''
+                SELECT sc.course_id, s.id, s.name, s.surname, s.age, s.city FROM Student_Courses sc
+                JOIN Courses c ON c.id = sc.course_id
+                JOIN Students s ON s.id = sc.student_id
+                ORDER BY sc.course_id, s.id
+            ''')
+        by_id = {}
+        for course in courses:
+            course.students = []
+            by_id[course.id] = course
+        students = {}
+        for row in links:
+            course = by_id.get(row[0])
+            if course is None:
+                continue
+            student = students.get(row[1])
+            if student is None:
+                student = students[row[1]] = Student.from_tuple(row[1:])
+            course.students.append(student)
+        return courses
+
+    @instrumented
     def get_by_id(self, course_id: int) -> Optional[Course]:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT * FROM Courses WHERE id = ?", (course_id,))
-        row = cursor.fetchone()
-        return Course.from_row(row) if row else None
+        if self.identity_map is not None:
+            course = self.identity_map.get(Course, course_id)
+            if course is not None:
+                return course
+        course = self._fetch_one(f"SELECT {Course.SELECT_COLUMNS} FROM Courses WHERE id = ?",
+                                 (course_id,), Course.from_tuple)
+        if course is not None and self.identity_map is not None:
+            self.identity_map.put(course)
+        return course
+
+    @instrumented
+    def get_by_name(self, course_name: str) -> Optional[Course]:
+        """Курс по названию - из каталога, если он подключен"""
+        if self.catalog is not None:
+            course_id = self.catalog.id_for(course_name)
+            return self.catalog.get(course_id) if course_id is not None else None
+        return self._fetch_one(f"SELECT {Course.SELECT_COLUMNS} FROM Courses WHERE name = ?",
+                               (course_name,), Course.from_tuple)
+
+    @instrumented
+    def city_breakdown(self, course_id: Optional[int] = None) -> List[CourseCityCount]:
+        """Студенты по городам для курса (или всех курсов) - читает только сводку Course_City_Roster"""
+        if course_id is None:
+            return self._fetch_all(
+                "SELECT course_id, city, students FROM Course_City_Roster ORDER BY course_id, city",
+                (), lambda row: CourseCityCount(*row)
+            )
+        return self._fetch_all(
+            "SELECT course_id, city, students FROM Course_City_Roster WHERE course_id = ? ORDER BY city",
+            (course_id,), lambda row: CourseCityCount(*row)
+        )
 
+    @instrumented
+    def students_per_course(self) -> Dict[int, int]:
+        """{course_id: число студентов} по сводке Course_City_Roster"""
+        return dict(self._fetch_all(
+            "SELECT course_id, SUM(students) FROM Course_City_Roster GROUP BY course_id"
+        ))
+
+    @instrumented
     def count(self) -> int:
-        cursor = self.db.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM Courses")
-        return cursor.fetchone()['count']
+        """Число курсов из Table_Counters - O(1) вместо обхода таблицы"""
+        return self._fetch_one("SELECT row_count FROM Table_Counters WHERE name = 'Courses'")[0]
 
 
-class EnrollmentRepository:
-    def __init__(self, db_connection: sqlite3.Connection):
-        self.db = db_connection
+class EnrollmentRepository(BaseRepository):
+    STUDENTS_ON_COURSE_QUERY = '''
+        SELECT s.id, s.name, s.surname, s.age, s.city FROM Students s
+        JOIN Student_Courses sc ON s.id = sc.student_id
+        WHERE sc.course_id = ?
+    '''
 
+    @instrumented
     def enroll(self, student_id: int, course_id: int) -> bool:
         """Запись на курс с обработкой ошибок"""
         try:
-            cursor = self.db.cursor()
-            cursor.execute(
+            self._execute(
                 "INSERT INTO Student_Courses (student_id, course_id) VALUES (?, ?)",
                 (student_id, course_id)
             )
@@ -183,48 +1120,254 @@ class EnrollmentRepository:
         except sqlite3.Error as e:
             raise DatabaseError(f"Ошибка базы данных: {e}")
 
+    @instrumented
+    def enroll_many(self, pairs: Iterable[Tuple[int, int]]) -> EnrollmentReport:
+        """
+        Массовая запись на курсы БЕЗ коммита.
+        Пары загружаются во временную таблицу одним executemany, классифицируются
+        и вставляются одним INSERT OR IGNORE ... SELECT - без исключения на каждый дубликат.
+        """
+        for statement in ENROLL_STAGE_SETUP:
+            self._execute(statement)
+        self._execute_many(ENROLL_STAGE_INSERT, pairs)
+
+        report = EnrollmentReport()
+        report.missing_students = self._fetch_all(ENROLL_MISSING_STUDENTS, (), tuple)
+        report.missing_courses = self._fetch_all(ENROLL_MISSING_COURSES, (), tuple)
+        report.duplicates = self._fetch_all(ENROLL_DUPLICATES, (), tuple)
+        report.inserted = self._execute(ENROLL_INSERT).rowcount
+        self._execute(ENROLL_STAGE_CLEAR)
+        return report
+
+    @instrumented
     def get_students_on_course(self, course_id: int) -> List[Student]:
-        cursor = self.db.cursor()
-        cursor.execute('''
-            SELECT s.* FROM Students s
-            JOIN Student_Courses sc ON s.id = sc.student_id
-            WHERE sc.course_id = ?
-        ''', (course_id,))
-        return [Student.from_row(row) for row in cursor.fetchall()]
+        return self._fetch_all(self.STUDENTS_ON_COURSE_QUERY, (course_id,), Student.from_tuple)
+
+    def iter_students_on_course(self, course_id: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        return self._stream(self.STUDENTS_ON_COURSE_QUERY, (course_id,), Student.from_tuple, batch_size)
+
+class ReportRepository(BaseRepository):
+    """
+    Агрегатные отчеты, вычисляемые в SQL. Каждый отчет - один запрос,
+    читающий индексы (покрывающие там, где это возможно), а не строки таблиц.
+    """
+
+    @instrumented
+    def enrollment_per_course(self) -> List[CourseEnrollment]:
+        return self._fetch_all('''
+            SELECT c.id, c.name,
+                   (SELECT COUNT(*) FROM Student_Courses sc WHERE sc.course_id = c.id)
+            FROM Courses c
+            ORDER BY c.id
+        ''', (), lambda row: CourseEnrollment(*row))
+
+    @instrumented
+    def students_per_city(self) -> List[CityCount]:
+        return self._fetch_all(
+            "SELECT city, COUNT(*) AS students FROM Students GROUP BY city ORDER BY students DESC, city",
+            (), lambda row: CityCount(*row)
+        )
+
+    @instrumented
+    def age_histogram(self, bucket_size: int = 10) -> List[AgeBucket]:
+        """Гистограмма возрастов с шагом bucket_size лет (пустые интервалы не выводятся)"""
+        if bucket_size < 1:
+            raise ValueError("Шаг гистограммы должен быть положительным")
+        return self._fetch_all(
+            "SELECT age / ? AS bucket, COUNT(*) FROM Students GROUP BY bucket ORDER BY bucket",
+            (bucket_size,),
+            lambda row: AgeBucket(row[0] * bucket_size, (row[0] + 1) * bucket_size - 1, row[1])
+        )
+
+    @instrumented
+    def average_age_per_course(self) -> List[CourseAgeStats]:
+        return self._fetch_all('''
+            SELECT c.id, c.name, COUNT(s.id), AVG(s.age)
+            FROM Courses c
+            LEFT JOIN Student_Courses sc ON sc.course_id = c.id
+            LEFT JOIN Students s ON s.id = sc.student_id
+            GROUP BY c.id
+            ORDER BY c.id
+        ''', (), lambda row: CourseAgeStats(*row))
+
+    @instrumented
+    def courses_per_student(self) -> List[CoursesPerStudent]:
+        """Распределение числа курсов на студента, включая студентов без курсов"""
+        # Группировка идет по первичному ключу Student_Courses (student_id, course_id),
+        # студенты без курсов - разность счетчиков: число студентов берется из Table_Counters,
+        # без обхода Students по строкам
+        rows = self._fetch_all('''
+            WITH per_student AS (
+                SELECT COUNT(*) AS courses FROM Student_Courses GROUP BY student_id
+            )
+            SELECT 0, (SELECT row_count FROM Table_Counters WHERE name = 'Students')
+                      - (SELECT COUNT(*) FROM per_student)
+            UNION ALL
+            SELECT courses, COUNT(*) FROM per_student GROUP BY courses
+        ''', (), lambda row: CoursesPerStudent(*row))
+        return [row for row in rows if row.students > 0]
+
+
+class MaintenanceRepository(BaseRepository):
+    """Обслуживание производных данных (счетчики, сводки) БЕЗ коммита"""
+
+    @instrumented
+    def reconcile_counters(self) -> Dict[str, Tuple[int, int]]:
+        """Пересчет Table_Counters по фактическому COUNT(*); {таблица: (было, стало)}"""
+        before = dict(self._fetch_all("SELECT name, row_count FROM Table_Counters"))
+        result = {}
+        for table in COUNTED_TABLES:
+            actual = self._fetch_one(f"SELECT COUNT(*) FROM {table}")[0]
+            self._execute(
+                "INSERT OR REPLACE INTO Table_Counters (name, row_count) VALUES (?, ?)", (table, actual)
+            )
+            result[table] = (before.get(table, 0), actual)
+        return result
+
+    @instrumented
+    def rebuild_course_rosters(self) -> int:
+        """Полный пересчет Course_City_Roster из базовых таблиц; возвращает число строк сводки"""
+        self._execute("DELETE FROM Course_City_Roster")
+        return self._execute(COURSE_ROSTER_REBUILD).rowcount
+
 
 # =============================================================================
 # СЛОЙ БИЗНЕС-ЛОГИКИ (УПРАВЛЕНИЕ ТРАНЗАКЦИЯМИ)
 # =============================================================================
 
 class SchoolService:
-    """Сервисный слой управляет транзакциями на уровне бизнес-операций"""
-
-    def __init__(self, db_connection: sqlite3.Connection):
+    """
+    Сервисный слой управляет транзакциями на уровне бизнес-операций.
+    identity_map_size - размер карты идентичности сессии (0 - без кеширования сущностей);
+    query_cache - общий кэш результатов чтения (None - выключен);
+    course_catalog - держать Courses в памяти и искать курсы по названию без JOIN
+    (выключен по умолчанию: выигрыша на индексированном Courses.name нет, а чужие
+    переименования и удаления курсов видны с задержкой до CourseCatalog.max_age);
+    router - db_connection только для чтения, блоки transaction() получают писателя роутера;
+    запись репозиториев вне transaction() отклоняется DatabaseError до выполнения.
+    """
+
+    def __init__(self, db_connection: sqlite3.Connection, profile: Optional[str] = None,
+                 stats: Optional[QueryStats] = None, slow_log: Optional[SlowQueryLog] = None,
+                 identity_map_size: int = 1000, query_cache: Optional[QueryCache] = None,
+                 course_catalog: bool = False, router: Optional['ConnectionRouter'] = None):
         self.db = db_connection
-        self.students = StudentRepository(db_connection)
-        self.courses = CourseRepository(db_connection)
-        self.enrollments = EnrollmentRepository(db_connection)
+        self.router = router
+        self._reader = db_connection
+        self.profile = profile
+        self.stats = stats
+        self.slow_log = slow_log
+        self.query_cache = query_cache
+        self.identity_map = IdentityMap(identity_map_size) if identity_map_size > 0 else None
+        self.students = StudentRepository(db_connection, stats, slow_log, query_cache)
+        self.courses = CourseRepository(db_connection, stats, slow_log, query_cache)
+        self.enrollments = EnrollmentRepository(db_connection, stats, slow_log, query_cache)
+        self.reports = ReportRepository(db_connection, stats, slow_log, query_cache)
+        self.maintenance = MaintenanceRepository(db_connection, stats, slow_log, query_cache)
+        self.students.identity_map = self.courses.identity_map = self.identity_map
+        self.catalog = CourseCatalog(db_connection, Course.from_tuple) if course_catalog else None
+        self.students.catalog = self.courses.catalog = self.catalog
+        self._depth = 0  # вложенность transaction(): 0 - вне транзакции
+        self._bind(db_connection)
+
+    def _bind(self, conn: sqlite3.Connection) -> None:
+        """Переключает сервис и репозитории на соединение conn"""
+        self.db = conn
+        readonly = self.router is not None and conn is self._reader
+        for repository in (self.students, self.courses, self.enrollments, self.reports, self.maintenance):
+            repository.db = conn
+            repository.readonly = readonly
+        if self.catalog is not None:
+            self.catalog.db = conn
+
+    def _invalidate(self) -> None:
+        """Сброс карты идентичности на границе транзакции"""
+        if self.identity_map is not None:
+            self.identity_map.clear()
 
     def commit(self) -> None:
         """Явный коммит изменений"""
         self.db.commit()
+        self._invalidate()
+        if self.query_cache is not None:
+            self.query_cache.commit(self.db)
 
     def rollback(self) -> None:
         """Откат изменений"""
         self.db.rollback()
+        self._discard_caches()
+        if self.query_cache is not None:
+            self.query_cache.rollback(self.db)
+
+    def _discard_caches(self) -> None:
+        """Сброс всего, что могло видеть откаченные изменения
+        (кэш чтений внутри транзакции не пополняется - его сбрасывать не нужно)"""
+        self._invalidate()
+        # total_changes после отката не меняется - каталог мог видеть откаченный курс
+        if self.catalog is not None:
+            self.catalog.invalidate()
+
+    def diagnostics(self) -> Dict[str, Any]:
+        """Активный профиль производительности, фактические PRAGMA соединения и счетчики кэша"""
+        result = {'profile': self.profile, 'pragmas': read_pragmas(self.db)}
+        if self.query_cache is not None:
+            result['query_cache'] = self.query_cache.stats()
+        return result
 
     @contextmanager
     def transaction(self):
         """
         Контекстный менеджер для атомарных операций.
         Автоматически коммитит при успехе, откатывает при ошибке.
+        Вложенный блок - SAVEPOINT: при ошибке откатывается только он,
+        внешняя транзакция продолжается (так WriteQueue изолирует операции пачки).
         """
+        if self._depth:
+            savepoint = f"sp_{self._depth}"
+            self.db.execute(f"SAVEPOINT {savepoint}")
+            self._depth += 1
+            try:
+                yield self
+            except Exception as e:
+                self._discard_caches()
+                # Ошибка SQLite могла уже откатить всю транзакцию - тогда точки сохранения нет,
+                # и продолжать внешний блок нельзя: его прежние изменения потеряны
+                if not self.db.in_transaction:
+                    raise DatabaseError(f"Транзакция откачена целиком: {e}") from e
+                self.db.execute(f"ROLLBACK TO {savepoint}")
+                self.db.execute(f"RELEASE {savepoint}")
+                raise
+            else:
+                self.db.execute(f"RELEASE {savepoint}")
+            finally:
+                self._depth -= 1
+            return
+
+        if self.router is not None:
+            # Единственный писатель: ждем его, пока его держит другая сессия
+            writer = self.router.writer.acquire()
+            if self.stats is not None:
+                writer.set_trace_callback(self.stats.trace)
+            self._bind(writer)
         try:
-            yield self
-            self.db.commit()
-        except Exception:
-            self.db.rollback()
-            raise
+            # Явный BEGIN: иначе первый SAVEPOINT сам открыл бы транзакцию, а его RELEASE - закоммитил
+            if not self.db.in_transaction:
+                self.db.execute("BEGIN")
+            self._depth = 1
+            try:
+                yield self
+                self.commit()
+            except Exception:
+                self.rollback()
+                raise
+        finally:
+            self._depth = 0
+            if self.router is not None:
+                writer = self.db
+                self._bind(self._reader)
+                if self.stats is not None:
+                    writer.set_trace_callback(None)
+                self.router.writer.release(writer)
 
     # Бизнес-методы с транзакциями
     def create_student(self, student_data: Dict[str, Any]) -> int:
@@ -233,6 +1376,19 @@ class SchoolService:
             student = Student(**student_data)
             return self.students.create(student)
 
+    def create_students(self, students: Iterable[Union[Student, Dict[str, Any]]],
+                        chunk_size: int = 1000) -> List[int]:
+        """Массовое создание студентов: по транзакции на каждые chunk_size записей"""
+        ids: List[int] = []
+        students = iter(students)
+        while True:
+            chunk = [s if isinstance(s, Student) else Student(**s)
+                     for s in islice(students, chunk_size)]
+            if not chunk:
+                return ids
+            with self.transaction():
+                ids.extend(self.students.create_many(chunk))
+
     def create_student_with_enrollment(self, student_data: Dict[str, Any], course_id: int) -> int:
         """Атомарная операция: студент + запись на курс"""
         with self.transaction():
@@ -244,84 +1400,904 @@ class SchoolService:
 
             return student_id
 
-    def update_student(self, student_id: int, update_data: Dict[str, Any]) -> bool:
-        """Обновление студента в транзакции"""
+    def enroll_many(self, pairs: Iterable[Tuple[int, int]]) -> EnrollmentReport:
+        """Массовая запись на курсы одной транзакцией"""
         with self.transaction():
-            student = self.students.get_by_id(student_id)
-            if not student:
-                raise ValidationError(f"Студент с ID {student_id} не найден")
+            return self.enrollments.enroll_many(pairs)
+
+    def reconcile_counters(self) -> Dict[str, Tuple[int, int]]:
+        """Пересчет счетчиков строк в транзакции (после обслуживания в обход триггеров)"""
+        with self.transaction():
+            return self.maintenance.reconcile_counters()
 
-            for key, value in update_data.items():
-                if hasattr(student, key) and value is not None:
-                    setattr(student, key, value)
+    def rebuild_course_rosters(self) -> int:
+        """Пересчет сводки Course_City_Roster в транзакции (восстановление после сбоя)"""
+        with self.transaction():
+            return self.maintenance.rebuild_course_rosters()
 
-            return self.students.update(student)
+    def update_student(self, student_id: int, update_data: Dict[str, Any]) -> bool:
+        """Обновление студента в транзакции (одним UPDATE ... RETURNING)"""
+        changes = {key: value for key, value in update_data.items() if value is not None}
+        with self.transaction():
+            if self.students.update_returning(student_id, changes) is None:
+                raise ValidationError(f"Студент с ID {student_id} не найден")
+            return True
 
     def delete_student(self, student_id: int) -> bool:
-        """Удаление студента в транзакции"""
+        """Удаление студента в транзакции (одним DELETE ... RETURNING)"""
         with self.transaction():
-            student = self.students.get_by_id(student_id)
-            if not student:
+            if self.students.delete_returning(student_id) is None:
                 raise ValidationError(f"Студент с ID {student_id} не найден")
-            return self.students.delete(student_id)
+            return True
+
+    def enroll(self, student_id: int, course_id: int) -> bool:
+        """Запись студента на курс в транзакции"""
+        with self.transaction():
+            return self.enrollments.enroll(student_id, course_id)
+
+
+class WriteQueue:
+    """
+    Write-behind очередь с групповым коммитом.
+    Операции из любых потоков ставятся в очередь и выполняются одним потоком-писателем:
+    пачка до max_batch операций, набранная не дольше max_latency_ms с первой операции,
+    выполняется одной транзакцией - один коммит (и fsync) на пачку вместо одного на операцию.
+    Каждая операция идет в своем SAVEPOINT, поэтому ошибка одной не откатывает остальные.
+    Результат или исключение возвращается через Future только после коммита пачки.
+
+    manager используется очередью монопольно: поток-писатель держит его соединение
+    все время работы очереди.
+    """
+
+    _STOP = object()
+
+    def __init__(self, manager: 'DatabaseManager', max_batch: int = 100,
+                 max_latency_ms: float = 2.0):
+        if max_batch < 1:
+            raise ValueError("Размер пачки должен быть не меньше 1")
+        self.manager = manager
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.operations = 0
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+        self._worker = threading.Thread(target=self._run, name='school-write-queue', daemon=True)
+        self._worker.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    def submit(self, operation: Callable[[SchoolService], Any]) -> Future:
+        """Ставит операцию operation(service) в очередь; Future получит ее результат"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise DatabaseError("Очередь записи закрыта")
+            self._queue.put((future, operation))
+        return future
+
+    def create_student(self, student_data: Dict[str, Any]) -> Future:
+        return self.submit(lambda service: service.create_student(student_data))
+
+    def create_student_with_enrollment(self, student_data: Dict[str, Any], course_id: int) -> Future:
+        return self.submit(lambda service: service.create_student_with_enrollment(student_data, course_id))
+
+    def enroll(self, student_id: int, course_id: int) -> Future:
+        return self.submit(lambda service: service.enroll(student_id, course_id))
+
+    def update_student(self, student_id: int, update_data: Dict[str, Any]) -> Future:
+        return self.submit(lambda service: service.update_student(student_id, update_data))
+
+    def _run(self) -> None:
+        try:
+            service = self.manager.__enter__()
+        except BaseException as e:
+            self._startup_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_latency
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._flush(service, batch)
+        finally:
+            self.manager.__exit__(None, None, None)
+
+    def _flush(self, service: SchoolService, batch: List[Tuple[Future, Callable]]) -> None:
+        """Одна транзакция на пачку, SAVEPOINT на операцию"""
+        outcomes = []
+        try:
+            with service.transaction():
+                for future, operation in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with service.transaction():
+                            outcomes.append((future, operation(service), None))
+                    except Exception as e:
+                        if not service.db.in_transaction:
+                            raise  # транзакция пачки уже откачена - продолжать нельзя
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # Пачка не выполнена или не закоммичена - ни одна операция не сохранена
+            errors = {future: error for future, _, error in outcomes if error is not None}
+            for future, _ in batch:
+                if not future.done() and (future.running() or future.set_running_or_notify_cancel()):
+                    future.set_exception(errors.get(future, e))
+            return
+        finally:
+            self.batches += 1
+            self.operations += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'avg_batch': self.operations / self.batches if self.batches else 0.0,
+            'pending': self._queue.qsize(),
+        }
+
+    def close(self) -> None:
+        """Дожидается выполнения уже поставленных операций и останавливает поток-писатель"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(self._STOP)
+        self._worker.join()
+
+    def __enter__(self) -> 'WriteQueue':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncRepository:
+    """
+    Асинхронный фасад репозитория для чтения:
+        await service.students.get_by_id(1)
+        async for student in service.students.iter_all()
+    Методы выполняются в потоках-читателях; ленивый StudentQuery материализуется там же.
+    Запись через фасад запрещена - для нее методы AsyncSchoolService.
+    """
+
+    WRITE_METHODS = frozenset({
+        'create', 'create_many', 'update', 'update_returning', 'delete', 'delete_returning',
+        'enroll', 'enroll_many', 'reconcile_counters', 'rebuild_course_rosters',
+    })
+
+    def __init__(self, service: 'AsyncSchoolService', name: str):
+        self._service = service
+        self._name = name
+
+    def __getattr__(self, method: str):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        if method in self.WRITE_METHODS:
+            raise AttributeError(f"{self._name}.{method} изменяет данные - используйте методы AsyncSchoolService")
+        name = self._name
+
+        if method.startswith('iter'):
+            def stream(*args, batch_size: int = DEFAULT_BATCH_SIZE, **kwargs):
+                return self._service.stream(
+                    lambda service: getattr(getattr(service, name), method)(*args, **kwargs), batch_size
+                )
+            return stream
+
+        def run(service: SchoolService, args, kwargs):
+            result = getattr(getattr(service, name), method)(*args, **kwargs)
+            return result.all() if isinstance(result, StudentQuery) else result
+
+        async def call(*args, **kwargs):
+            return await self._service.read(partial(run, args=args, kwargs=kwargs))
+        return call
+
+
+class AsyncSchoolService:
+    """
+    asyncio-фасад SchoolService: операции SQLite выполняются вне цикла событий.
+    Запись - в одном выделенном потоке-писателе (SQLite допускает одного писателя,
+    очередь к нему дешевле, чем ожидание блокировки), чтение - в пуле из readers потоков.
+    У каждого потока своя сессия SchoolService на своем соединении из общего пула.
+
+        async with AsyncSchoolService('school.db', readers=4) as service:
+            student_id = await service.create_student({...})
+            students = await service.students.get_by_city('Spb')
+            async for student in service.students.iter_all():
+                ...
+    """
+
+    def __init__(self, db_name: str = 'school.db', readers: int = 4, profile: str = 'durable',
+                 stats: Optional[QueryStats] = None, slow_query_ms: Optional[float] = None,
+                 query_cache: Optional[QueryCache] = None):
+        if readers < 1:
+            raise ValueError("Нужен хотя бы один поток-читатель")
+        self.db_name = db_name
+        self.profile = profile
+        self.pool = ConnectionPool(db_name, max_size=readers + 1,
+                                   initializer=partial(DatabaseManager.prepare_connection, profile=profile))
+        self.pool.profile = profile
+        self._manager_options = {'profile': profile, 'stats': stats,
+                                 'slow_query_ms': slow_query_ms, 'query_cache': query_cache}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='school-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='school-reader')
+        self._local = threading.local()
+        self._managers: List[DatabaseManager] = []
+        self._managers_lock = threading.Lock()
+
+        self.students = AsyncRepository(self, 'students')
+        self.courses = AsyncRepository(self, 'courses')
+        self.enrollments = AsyncRepository(self, 'enrollments')
+        self.reports = AsyncRepository(self, 'reports')
+
+    def _session(self, reader: bool) -> SchoolService:
+        """Сессия текущего потока (создается при первом обращении)"""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            # Читатели не коммитят - карта идентичности у них не сбрасывалась бы и устаревала
+            manager = DatabaseManager(self.db_name, pool=self.pool,
+                                      identity_map_size=0 if reader else 1000, **self._manager_options)
+            service = self._local.service = manager.__enter__()
+            with self._managers_lock:
+                self._managers.append(manager)
+        return service
+
+    def _run_read(self, operation: Callable[[SchoolService], Any]):
+        return operation(self._session(reader=True))
+
+    def _run_write(self, operation: Callable[[SchoolService], Any], atomic: bool = True):
+        """atomic=False - operation сама управляет транзакциями"""
+        service = self._session(reader=False)
+        if not atomic:
+            return operation(service)
+        with service.transaction():
+            return operation(service)
+
+    async def read(self, operation: Callable[[SchoolService], Any]):
+        """operation(service) в потоке-читателе"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, operation)
+
+    async def write(self, operation: Callable[[SchoolService], Any]):
+        """operation(service) в потоке-писателе, в транзакции"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, operation)
+
+    async def stream(self, produce: Callable[[SchoolService], Iterable], batch_size: int = DEFAULT_BATCH_SIZE,
+                     prefetch: int = 2):
+        """
+        Асинхронная итерация по большому результату: поток-читатель перебирает
+        produce(service) и передает порции по batch_size через asyncio.Queue.
+        Очередь ограничена prefetch порциями - читатель ждет, пока потребитель не догонит.
+        На все время итерации занимает один поток-читатель.
+        """
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> None:
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def producer(service: SchoolService) -> None:
+            rows = None
+            try:
+                rows = iter(produce(service))
+                while not stop.is_set():
+                    chunk = list(islice(rows, batch_size))
+                    if not chunk:
+                        break
+                    put(chunk)
+            finally:
+                close = getattr(rows, 'close', None)
+                if close is not None:
+                    close()
+                put(done)
+
+        task = loop.run_in_executor(self._readers, self._run_read, producer)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                for item in chunk:
+                    yield item
+            await task  # ошибка чтения пробрасывается потребителю
+        finally:
+            if not task.done():
+                # Потребитель вышел раньше: останавливаем читателя и освобождаем ему место в очереди
+                stop.set()
+                while not task.done():
+                    getter = asyncio.ensure_future(chunks.get())
+                    await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                    getter.cancel()
+                task.exception()
+
+    # Бизнес-методы SchoolService в потоке-писателе
+    async def create_student(self, student_data: Dict[str, Any]) -> int:
+        return await self.write(lambda service: service.create_student(student_data))
+
+    async def create_students(self, students: Iterable[Union[Student, Dict[str, Any]]],
+                              chunk_size: int = 1000) -> List[int]:
+        """
+        Вход перебирается в потоке-писателе порциями по chunk_size (по транзакции
+        на порцию, как SchoolService.create_students) - в памяти одна порция.
+        Генератор не должен обращаться к циклу событий: он выполняется в другом потоке.
+        """
+        loop = asyncio.get_running_loop()
+        operation = partial(SchoolService.create_students, students=students, chunk_size=chunk_size)
+        return await loop.run_in_executor(self._writer, partial(self._run_write, operation, atomic=False))
+
+    async def create_student_with_enrollment(self, student_data: Dict[str, Any], course_id: int) -> int:
+        return await self.write(lambda service: service.create_student_with_enrollment(student_data, course_id))
+
+    async def enroll(self, student_id: int, course_id: int) -> bool:
+        return await self.write(lambda service: service.enroll(student_id, course_id))
+
+    async def enroll_many(self, pairs: Iterable[Tuple[int, int]]) -> EnrollmentReport:
+        pairs = list(pairs)
+        return await self.write(lambda service: service.enroll_many(pairs))
+
+    async def update_student(self, student_id: int, update_data: Dict[str, Any]) -> bool:
+        return await self.write(lambda service: service.update_student(student_id, update_data))
+
+    async def delete_student(self, student_id: int) -> bool:
+        return await self.write(lambda service: service.delete_student(student_id))
+
+    def _shutdown(self) -> None:
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._managers_lock:
+            managers, self._managers = self._managers, []
+        # Соединения пула открыты с check_same_thread=False - вернуть их можно из этого потока
+        for manager in managers:
+            manager.__exit__(None, None, None)
+        self.pool.close()
+
+    async def close(self) -> None:
+        """Дожидается запущенных операций и закрывает соединения"""
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+
+    async def __aenter__(self) -> 'AsyncSchoolService':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
 # =============================================================================
 # СЛОЙ БАЗЫ ДАННЫХ
 # =============================================================================
 
+# Версия схемы хранится в PRAGMA user_version файла БД.
+# Миграция N переводит схему из версии N-1 в N (DDL должен быть идемпотентным,
+# чтобы применяться и к файлам, созданным до появления версионирования).
+SCHEMA_VERSION = 4
+
+# Таблицы, число строк которых хранится в Table_Counters
+COUNTED_TABLES = ('Students', 'Courses', 'Student_Courses')
+
+# Полный пересчет сводки "студенты курса по городам" из базовых таблиц
+COURSE_ROSTER_REBUILD = '''
+    INSERT INTO Course_City_Roster (course_id, city, students)
+    SELECT sc.course_id, s.city, COUNT(*) FROM Student_Courses sc
+    JOIN Students s ON s.id = sc.student_id
+    GROUP BY sc.course_id, s.city
+'''
+
+SCHEMA_MIGRATIONS: Dict[int, List[str]] = {
+    1: [
+        '''
+        CREATE TABLE IF NOT EXISTS Students(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            surname TEXT NOT NULL,
+            age INTEGER NOT NULL CHECK (age >= 14),
+            city TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Courses(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            time_start TEXT NOT NULL,
+            time_end TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Student_Courses(
+            student_id INTEGER,
+            course_id INTEGER,
+            FOREIGN KEY (student_id) REFERENCES Students(id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
+            PRIMARY KEY (student_id, course_id)
+        )
+        ''',
+    ],
+    # Вторичные индексы: фильтры по городу/возрасту и выборки со стороны курса.
+    # Первичный ключ (student_id, course_id) не помогает при поиске по course_id,
+    # поэтому нужен покрывающий (course_id, student_id).
+    2: [
+        "CREATE INDEX IF NOT EXISTS idx_students_city ON Students(city)",
+        "CREATE INDEX IF NOT EXISTS idx_students_age ON Students(age)",
+        "CREATE INDEX IF NOT EXISTS idx_student_courses_course ON Student_Courses(course_id, student_id)",
+    ],
+    # Счетчики строк для count() за O(1): поддерживаются триггерами INSERT/DELETE
+    # (каскадное удаление записей студента тоже срабатывает триггером).
+    # После массового обслуживания в обход триггеров - reconcile_counters().
+    3: [
+        '''
+        CREATE TABLE IF NOT EXISTS Table_Counters(
+            name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        *(f"INSERT OR REPLACE INTO Table_Counters (name, row_count) SELECT '{table}', COUNT(*) FROM {table}"
+          for table in COUNTED_TABLES),
+        *(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_count_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            UPDATE Table_Counters SET row_count = row_count {sign} 1 WHERE name = '{table}';
+        END
+        ''' for table in COUNTED_TABLES for event, sign in (('INSERT', '+'), ('DELETE', '-'))),
+    ],
+    # Сводка Course_City_Roster (курс, город, число студентов) для дашбордов,
+    # поддерживается триггерами записи/отчисления, смены города и удаления студента.
+    # При каскадном удалении строка студента уже удалена к моменту триггера
+    # Student_Courses, поэтому вклад студента снимается в BEFORE DELETE ON Students.
+    4: [
+        '''
+        CREATE TABLE IF NOT EXISTS Course_City_Roster(
+            course_id INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            students INTEGER NOT NULL,
+            PRIMARY KEY (course_id, city)
+        ) WITHOUT ROWID
+        ''',
+        "DELETE FROM Course_City_Roster",
+        COURSE_ROSTER_REBUILD,
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_roster_enroll AFTER INSERT ON Student_Courses
+        BEGIN
+            INSERT INTO Course_City_Roster (course_id, city, students)
+            SELECT NEW.course_id, city, 1 FROM Students WHERE id = NEW.student_id
+            ON CONFLICT (course_id, city) DO UPDATE SET students = students + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_roster_unenroll AFTER DELETE ON Student_Courses
+        BEGIN
+            UPDATE Course_City_Roster SET students = students - 1
+            WHERE course_id = OLD.course_id
+              AND city = (SELECT city FROM Students WHERE id = OLD.student_id);
+            DELETE FROM Course_City_Roster WHERE course_id = OLD.course_id AND students <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_roster_reenroll AFTER UPDATE OF student_id, course_id ON Student_Courses
+        BEGIN
+            UPDATE Course_City_Roster SET students = students - 1
+            WHERE course_id = OLD.course_id
+              AND city = (SELECT city FROM Students WHERE id = OLD.student_id);
+            DELETE FROM Course_City_Roster WHERE course_id = OLD.course_id AND students <= 0;
+            INSERT INTO Course_City_Roster (course_id, city, students)
+            SELECT NEW.course_id, city, 1 FROM Students WHERE id = NEW.student_id
+            ON CONFLICT (course_id, city) DO UPDATE SET students = students + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_roster_student_city AFTER UPDATE OF city ON Students
+        WHEN OLD.city IS NOT NEW.city
+        BEGIN
+            UPDATE Course_City_Roster SET students = students - 1
+            WHERE city = OLD.city
+              AND course_id IN (SELECT course_id FROM Student_Courses WHERE student_id = NEW.id);
+            DELETE FROM Course_City_Roster WHERE city = OLD.city AND students <= 0;
+            INSERT INTO Course_City_Roster (course_id, city, students)
+            SELECT course_id, NEW.city, 1 FROM Student_Courses WHERE student_id = NEW.id
+            ON CONFLICT (course_id, city) DO UPDATE SET students = students + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_roster_student_delete BEFORE DELETE ON Students
+        BEGIN
+            UPDATE Course_City_Roster SET students = students - 1
+            WHERE city = OLD.city
+              AND course_id IN (SELECT course_id FROM Student_Courses WHERE student_id = OLD.id);
+            DELETE FROM Course_City_Roster WHERE city = OLD.city AND students <= 0;
+        END
+        ''',
+    ],
+}
+
+
+@dataclass
+class PoolStats:
+    """Снимок счетчиков пула для подбора его размера"""
+    max_size: int
+    size: int
+    in_use: int
+    idle: int
+    peak_in_use: int
+    checkouts: int
+    waits: int
+    timeouts: int
+    total_wait_time: float
+    max_wait_time: float
+    utilisation: float
+    avg_utilisation: float
+
+    @property
+    def avg_wait_time(self) -> float:
+        return self.total_wait_time / self.checkouts if self.checkouts else 0.0
+
+
+class ConnectionPool:
+    """
+    Ограниченный потокобезопасный пул соединений SQLite.
+    Соединения создаются лениво (не больше max_size), при создании проходят
+    initializer (PRAGMA, схема), при выдаче - проверку здоровья.
+    readonly=True - соединения открываются URI file:...?mode=ro.
+    """
+
+    def __init__(self, db_name: str, max_size: int = 5, timeout: float = 30.0,
+                 initializer: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 health_check_interval: float = 30.0, readonly: bool = False):
+        if max_size < 1:
+            raise ValueError("Размер пула должен быть не меньше 1")
+        self.db_name = db_name
+        self.readonly = readonly
+        self.max_size = max_size
+        self.timeout = timeout
+        self.initializer = initializer
+        self.profile: Optional[str] = None
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle: deque = deque()  # (соединение, время возврата в пул)
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Счетчики для подбора размера пула
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._created_at = time.monotonic()
+        self._busy_since = self._created_at
+        self._busy_integral = 0.0  # сумма in_use * dt
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            uri = Path(self.db_name).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        try:
+            if self.initializer:
+                self.initializer(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _account_busy(self) -> None:
+        """Накопление интеграла занятости (вызывается под блокировкой)"""
+        now = time.monotonic()
+        self._busy_integral += self._in_use * (now - self._busy_since)
+        self._busy_since = now
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """Выдача соединения из пула; ждет освобождения, если пул исчерпан"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise DatabaseError("Пул соединений закрыт")
+                if self._idle or self._size < self.max_size:
+                    break
+                waited = True
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not (self._idle or self._size < self.max_size):
+                        self._timeouts += 1
+                        raise DatabaseError(
+                            f"Нет свободных соединений в пуле за {timeout:.1f} с"
+                        )
+
+            if self._idle:
+                conn, released_at = self._idle.pop()
+            else:
+                conn, released_at = None, None
+                self._size += 1
+
+            self._account_busy()
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._checkouts += 1
+            wait_time = time.monotonic() - started
+            if waited:
+                self._waits += 1
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+
+        # Создание и проверка соединения - вне блокировки
+        try:
+            if conn is not None and time.monotonic() - released_at >= self.health_check_interval:
+                if not self._is_healthy(conn):
+                    conn.close()
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._account_busy()
+                self._in_use -= 1
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Возврат соединения; незавершенная транзакция откатывается"""
+        broken = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            broken = True
+
+        with self._cond:
+            self._account_busy()
+            self._in_use -= 1
+            if broken or self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Закрытие свободных соединений; занятые закроются при возврате"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> PoolStats:
+        with self._cond:
+            self._account_busy()
+            elapsed = max(time.monotonic() - self._created_at, 1e-9)
+            return PoolStats(
+                max_size=self.max_size,
+                size=self._size,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                peak_in_use=self._peak_in_use,
+                checkouts=self._checkouts,
+                waits=self._waits,
+                timeouts=self._timeouts,
+                total_wait_time=self._total_wait,
+                max_wait_time=self._max_wait,
+                utilisation=self._in_use / self.max_size,
+                avg_utilisation=self._busy_integral / (elapsed * self.max_size),
+            )
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name: str = 'school.db', max_size: int = 5,
+             profile: str = 'durable') -> ConnectionPool:
+    """Общий пул на файл БД и профиль (max_size учитывается только при создании пула)"""
+    with _pools_lock:
+        pool = _pools.get((db_name, profile))
+        if pool is None or pool._closed:
+            pool = ConnectionPool(db_name, max_size=max_size,
+                                  initializer=partial(DatabaseManager.prepare_connection,
+                                                      profile=profile))
+            pool.profile = profile
+            _pools[(db_name, profile)] = pool
+        return pool
+
+
+class ConnectionRouter:
+    """
+    Топология "один писатель - N читателей" под WAL.
+    SQLite допускает одного писателя: пул писателя из одного соединения выдается
+    только блокам transaction(), а чтения идут через пул соединений mode=ro.
+    В WAL читатели видят последний коммит и не ждут даже длинную запись.
+    """
+
+    def __init__(self, db_name: str = 'school.db', readers: int = 4, profile: str = 'balanced',
+                 timeout: float = 30.0):
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Неизвестный профиль '{profile}', доступны: {', '.join(PERFORMANCE_PROFILES)}")
+        if PERFORMANCE_PROFILES[profile].get('journal_mode') != 'WAL':
+            raise ValueError(f"Профиль '{profile}' без WAL: в журнале отката запись блокирует читателей")
+        self.db_name = db_name
+        self.profile = profile
+        self.writer = ConnectionPool(db_name, max_size=1, timeout=timeout,
+                                     initializer=partial(DatabaseManager.prepare_connection, profile=profile))
+        self.writer.profile = profile
+        # Писатель открывается первым: миграции и WAL должны быть до открытия соединений mode=ro
+        self.writer.release(self.writer.acquire())
+        self.readers = ConnectionPool(db_name, max_size=readers, timeout=timeout, readonly=True,
+                                      initializer=partial(DatabaseManager.prepare_reader, profile=profile))
+        self.readers.profile = profile
+
+    def stats(self) -> Dict[str, PoolStats]:
+        return {'writer': self.writer.stats(), 'readers': self.readers.stats()}
+
+    def close(self) -> None:
+        self.readers.close()
+        self.writer.close()
+
+
+def migrate(db_name: str) -> int:
+    """Приводит существующий файл БД к актуальной схеме; возвращает версию схемы"""
+    conn = sqlite3.connect(db_name)
+    try:
+        DatabaseManager._create_tables(conn)
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def close_pools() -> None:
+    """Закрытие всех общих пулов"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
 class DatabaseManager:
-    """Менеджер БД создает подключение и таблицы"""
+    """Менеджер БД выдает соединение из пула и создает таблицы"""
 
-    def __init__(self, db_name: str = 'school.db'):
+    def __init__(self, db_name: str = 'school.db', pool: Optional[ConnectionPool] = None,
+                 pool_size: int = 5, profile: str = 'durable',
+                 stats: Optional[QueryStats] = None, stats_path: Optional[str] = None,
+                 slow_query_ms: Optional[float] = None, identity_map_size: int = 1000,
+                 query_cache: Optional[QueryCache] = None, router: Optional[ConnectionRouter] = None):
+        """
+        stats включает замеры запросов; stats_path - файл для сохранения при выходе;
+        slow_query_ms - порог журнала медленных запросов (None - журнал выключен);
+        identity_map_size - размер карты идентичности сессии (0 - выключена);
+        query_cache - кэш результатов чтения, общий для сессий менеджера (None - выключен);
+        router - сессия читает через соединение mode=ro, а транзакции берут писателя роутера
+        """
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Неизвестный профиль '{profile}', доступны: {', '.join(PERFORMANCE_PROFILES)}")
         self.db_name = db_name
+        self.router = router
+        if router is not None:
+            pool = router.readers
+        self.pool = pool or get_pool(db_name, max_size=pool_size, profile=profile)
+        self.profile = self.pool.profile or profile
+        self.stats = stats
+        if stats is not None and stats_path:
+            stats.dump_at_exit(stats_path)
+        self.slow_log = SlowQueryLog(slow_query_ms) if slow_query_ms is not None else None
+        self.identity_map_size = identity_map_size
+        self.query_cache = query_cache
         self.conn: Optional[sqlite3.Connection] = None
 
     def __enter__(self) -> SchoolService:
-        self.conn = sqlite3.connect(self.db_name)
-        self.conn.row_factory = sqlite3.Row
-        self.conn.execute("PRAGMA foreign_keys = ON")
-
-        self._create_tables()
-        return SchoolService(self.conn)
+        self.conn = self.pool.acquire()
+        if self.stats is not None:
+            self.conn.set_trace_callback(self.stats.trace)
+        return SchoolService(self.conn, profile=self.profile, stats=self.stats, slow_log=self.slow_log,
+                             identity_map_size=self.identity_map_size, query_cache=self.query_cache,
+                             router=self.router)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.conn:
-            self.conn.close()
-
-    def _create_tables(self) -> None:
-        """Создание таблиц (коммит только для DDL)"""
-        cursor = self.conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Students(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                surname TEXT NOT NULL,
-                age INTEGER NOT NULL CHECK (age >= 14),
-                city TEXT NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Courses(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                time_start TEXT NOT NULL,
-                time_end TEXT NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Student_Courses(
-                student_id INTEGER,
-                course_id INTEGER,
-                FOREIGN KEY (student_id) REFERENCES Students(id) ON DELETE CASCADE,
-                FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
-                PRIMARY KEY (student_id, course_id)
-            )
-        ''')
+            if self.stats is not None:
+                self.conn.set_trace_callback(None)
+            self.pool.release(self.conn)
+            self.conn = None
+
+    def diagnostics(self) -> Dict[str, Any]:
+        """Активный профиль, фактические PRAGMA и счетчики пула"""
+        with self.pool.connection() as conn:
+            pragmas = read_pragmas(conn)
+        return {
+            'db_name': self.db_name,
+            'profile': self.profile,
+            'pragmas': pragmas,
+            'pool': self.pool.stats(),
+        }
+
+    @staticmethod
+    def prepare_connection(conn: sqlite3.Connection, profile: str = 'durable') -> None:
+        """Настройка нового соединения (выполняется один раз на соединение)"""
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        apply_profile(conn, profile)
+        DatabaseManager._create_tables(conn)
+
+    @staticmethod
+    def prepare_reader(conn: sqlite3.Connection, profile: str = 'balanced') -> None:
+        """Настройка соединения только для чтения: без миграций и смены журнала (их делает писатель)"""
+        conn.row_factory = sqlite3.Row
+        for pragma in ('cache_size', 'mmap_size', 'temp_store'):
+            conn.execute(f"PRAGMA {pragma} = {PERFORMANCE_PROFILES[profile][pragma]}").fetchall()
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection) -> None:
+        """
+        Создание/миграция схемы по PRAGMA user_version.
+        Если версия файла актуальна - ни одной записи и fsync не выполняется.
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
 
-        self.conn.commit()
+        # BEGIN IMMEDIATE: параллельные процессы не начнут миграцию одновременно
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                for statement in SCHEMA_MIGRATIONS[target]:
+                    conn.execute(statement)
+            if version < SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 # =============================================================================
 # ПОЛЬЗОВАТЕЛЬСКИЙ ИНТЕРФЕЙС
@@ -393,6 +2369,38 @@ class SchoolUI:
                   f"{student.age:<8} {student.city:<15}")
         print("-" * 60)
 
+    def browse_students(self, title: str, page_size: int = 20, ask_id: bool = False) -> str:
+        """
+        Постраничный просмотр студентов (keyset-пагинация по ID).
+        Возвращает ввод, завершивший просмотр (при ask_id - можно сразу ввести ID).
+        """
+        history: List[int] = []  # after_id предыдущих страниц
+        after_id = 0
+        while True:
+            self.clear_screen()
+            self.print_header(title)
+            page = self.service.students.page(after_id, page_size)
+            self.show_students(page.items)
+            print(f"Страница {len(history) + 1}")
+
+            commands = []
+            if page.has_more:
+                commands.append("n - следующая")
+            if history:
+                commands.append("p - предыдущая")
+            commands.append("ID студента" if ask_id else "Enter - продолжить")
+            command = input(f"{', '.join(commands)}: ").strip().lower()
+
+            if command == "n" and page.has_more:
+                history.append(after_id)
+                after_id = page.next_after_id
+            elif command == "p" and history:
+                after_id = history.pop()
+            elif command in ("n", "p"):
+                continue
+            else:
+                return command
+
     def menu_manage_students(self):
         """Главное меню управления студентами"""
         while True:
@@ -411,14 +2419,11 @@ class SchoolUI:
             choice = input("\nВаш выбор: ").strip()
 
             if choice == "1":
-                self.clear_screen()
-                self.print_header("ВСЕ СТУДЕНТЫ")
                 try:
-                    students = self.service.students.get_all()
-                    self.show_students(students)
+                    self.browse_students("ВСЕ СТУДЕНТЫ")
                 except Exception as e:
                     print(f"❌ Ошибка: {e}")
-                self.wait_for_enter()
+                    self.wait_for_enter()
 
             elif choice == "2":
                 self.clear_screen()
@@ -439,13 +2444,9 @@ class SchoolUI:
                 self.wait_for_enter()
 
             elif choice == "3":
-                self.clear_screen()
-                self.print_header("ОБНОВЛЕНИЕ СТУДЕНТА")
                 try:
-                    students = self.service.students.get_all()
-                    self.show_students(students)
-
-                    student_id = int(input("\nВведите ID студента: "))
+                    answer = self.browse_students("ОБНОВЛЕНИЕ СТУДЕНТА", ask_id=True)
+                    student_id = int(answer or input("\nВведите ID студента: "))
                     existing = self.service.students.get_by_id(student_id)
 
                     if not existing:
@@ -468,13 +2469,9 @@ class SchoolUI:
                 self.wait_for_enter()
 
             elif choice == "4":
-                self.clear_screen()
-                self.print_header("УДАЛЕНИЕ СТУДЕНТА")
                 try:
-                    students = self.service.students.get_all()
-                    self.show_students(students)
-
-                    student_id = int(input("\nВведите ID студента: "))
+                    answer = self.browse_students("УДАЛЕНИЕ СТУДЕНТА", ask_id=True)
+                    student_id = int(answer or input("\nВведите ID студента: "))
 
                     confirm = input("Удалить? (д/н): ").strip().lower()
                     if confirm in ['д', 'да', 'y', 'yes']:
@@ -512,6 +2509,31 @@ class SchoolUI:
             elif choice == "0":
                 break
 
+    def show_statistics(self):
+        """Сводная статистика (агрегаты считаются в SQL)"""
+        self.clear_screen()
+        self.print_header("СТАТИСТИКА")
+        reports = self.service.reports
+
+        print("\n📚 Записей на курсы / средний возраст:")
+        for course in reports.average_age_per_course():
+            average = f"{course.average_age:.1f}" if course.average_age is not None else "-"
+            print(f"  {course.name:<20} {course.students:>6}   {average:>6}")
+
+        print("\n🏙  Студентов по городам:")
+        for city in reports.students_per_city():
+            print(f"  {city.city:<20} {city.students:>6}")
+
+        print("\n🎂 Возраст:")
+        for bucket in reports.age_histogram():
+            print(f"  {bucket.age_from:>3}-{bucket.age_to:<3}{'':<14} {bucket.students:>6}")
+
+        print("\n📝 Курсов на студента:")
+        for row in reports.courses_per_student():
+            print(f"  {row.courses:<20} {row.students:>6}")
+
+        self.wait_for_enter()
+
     def menu_atomic_operations(self):
         """Меню атомарных операций"""
         self.clear_screen()
@@ -574,6 +2596,7 @@ class SchoolUI:
             print("2. ⚡ Атомарные операции")
             print("3. 💾 Сохранить")
             print("4. ↩  Отменить изменения")
+            print("5. 📈 Статистика")
             print("0. 🚪 Выход")
             print("-" * 50)
 
@@ -591,6 +2614,8 @@ class SchoolUI:
                 self.service.rollback()
                 print("✅ Изменения откачены!")
                 self.wait_for_enter()
+            elif choice == "5":
+                self.show_statistics()
             elif choice == "0":
                 print("\n👋 До свидания!")
                 break
@@ -600,14 +2625,29 @@ class SchoolUI:
 # =============================================================================
 
 def main():
-    """Главная функция приложения"""
+    """Главная функция приложения (без команды - интерактивное меню)"""
+    parser = argparse.ArgumentParser(description="Школьная ORM система")
+    parser.add_argument('--db', default='school.db', help="файл базы данных")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('reconcile-counters', help="пересчитать счетчики строк (Table_Counters)")
+    commands.add_parser('rebuild-rosters', help="пересобрать сводку курсов по городам (Course_City_Roster)")
+    args = parser.parse_args()
+
     try:
-        with DatabaseManager() as service:
-            ui = SchoolUI(service)
-            ui.main_menu()
+        with DatabaseManager(args.db) as service:
+            if args.command == 'reconcile-counters':
+                for table, (before, actual) in service.reconcile_counters().items():
+                    mark = "✅" if before == actual else "🔧"
+                    print(f"{mark} {table}: {before} -> {actual}")
+            elif args.command == 'rebuild-rosters':
+                print(f"✅ Course_City_Roster: {service.rebuild_course_rosters()} строк")
+            else:
+                ui = SchoolUI(service)
+                ui.main_menu()
+        close_pools()
 
         print(f"\n✅ Программа завершена")
-        print(f"📁 База данных: {os.path.abspath('school.db')}")
+        print(f"📁 База данных: {os.path.abspath(args.db)}")
 
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")